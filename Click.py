@@ -1,9 +1,39 @@
 from dash import html
-import json
+from FastJson import dumps_pretty
 
 
-def node_clicked(node_data, all_nodes=None):
+def _raw_pretty(raw_obj):
+    """Return the Raw JSON panel text for raw_obj (main._node_panel caches the whole panel per node)."""
+    try:
+        return dumps_pretty(raw_obj)
+    except Exception:
+        return str(raw_obj)
+
+
+def _truthy(x):
+    """A content part counts if it is a non-blank string or any other non-None value."""
+    return x is not None and (not isinstance(x, str) or bool(x.strip()))
+
+
+def _has_meaningful_content(n_class, cont):
+    """Return True if a node has content worth showing (not empty/only N/A)."""
+    if cont is None:
+        return False
+    if isinstance(cont, (list, tuple)):
+        if n_class in ("MessageConfig", "CustomFieldDef") and len(cont) >= 3:
+            return any(_truthy(x) for x in cont[:3])
+        if n_class == "Incentive" and len(cont) >= 2:
+            return any(_truthy(x) for x in cont[:2])
+    if n_class == "ClientPageLayout":
+        return bool(cont) and bool(str(cont).strip())
+    if isinstance(cont, (list, tuple)):
+        return any(_truthy(x) for x in cont)
+    return bool(str(cont).strip())
+
+
+def node_clicked(node_data, reverse_adj=None):
     """Return a details panel for a clicked node with collapsible sections.
+    reverse_adj: optional dict from Nodes.build_reverse_index (name -> names referring to it).
     - Content: only if there is meaningful content (not empty/only N/A)
     - Connections: always included, with counts and clickable items
     - Raw JSON: only if raw exists and is non-empty
@@ -16,24 +46,7 @@ def node_clicked(node_data, all_nodes=None):
     node_class = node_data.get('class', 'N/A')
     content = node_data.get('content')
 
-    # Helper to determine if there is meaningful content to show
-    def has_meaningful_content(n_class, cont):
-        if cont is None:
-            return False
-        if n_class == "MessageConfig" and isinstance(cont, (list, tuple)) and len(cont) >= 3:
-            body, subject, notification = cont[0], cont[1], cont[2]
-            return any((isinstance(x, str) and x.strip()) or (x is not None and not isinstance(x, str)) for x in (body, subject, notification))
-        if n_class == "Incentive" and isinstance(cont, (list, tuple)) and len(cont) >= 2:
-            return any((isinstance(x, str) and x.strip()) or (x is not None and not isinstance(x, str)) for x in (cont[0], cont[1]))
-        if n_class == "CustomFieldDef" and isinstance(cont, (list, tuple)) and len(cont) >= 3:
-            return any((isinstance(x, str) and x.strip()) or (x is not None and not isinstance(x, str)) for x in (cont[0], cont[1], cont[2]))
-        if n_class == "ClientPageLayout":
-            return bool(str(cont or "").strip())
-        if isinstance(cont, (list, tuple)):
-            return any(str(x).strip() for x in cont if x is not None)
-        return bool(str(cont).strip())
-
-    show_content_section = has_meaningful_content(node_class, content)
+    show_content_section = _has_meaningful_content(node_class, content)
 
     # Prepare content body based on node type (only if meaningful)
     content_children = []
@@ -92,35 +105,21 @@ def node_clicked(node_data, all_nodes=None):
     outgoing_refs = node_data.get('connections', []) or []
 
     def make_node_item(name, display):
+        # Link look (no padding/border, underlined blue) comes from .node-link-btn in styles.css
         return html.Li(
             html.Button(
                 display,
                 id={"type": "node-link", "name": name},
-                n_clicks=0,
                 title=name,
-                style={
-                    "background": "none",
-                    "border": "none",
-                    "padding": 0,
-                    "margin": 0,
-                    "color": "#0b67c1",
-                    "textDecoration": "underline",
-                    "cursor": "pointer",
-                    "font": "inherit"
-                }
+                className="node-link-btn"
             )
         )
 
     outgoing_items = [make_node_item(ref, ref) for ref in outgoing_refs]
 
     incoming_items = []
-    if all_nodes:
-        seen = set()
-        for n in all_nodes:
-            for ref in (n.get('connections', []) or []):
-                if ref == node_data.get('name') and n['name'] not in seen:
-                    seen.add(n['name'])
-                    incoming_items.append(make_node_item(n['name'], n['name']))
+    if reverse_adj:
+        incoming_items = [make_node_item(name, name) for name in reverse_adj.get(node_data.get('name'), [])]
 
     # Summary with counts
     summary_label = f"Connections ({len(outgoing_items)} out, {len(incoming_items)} in)"
@@ -145,10 +144,7 @@ def node_clicked(node_data, all_nodes=None):
     show_raw_section = raw_obj is not None and bool(raw_obj)
     raw_section = None
     if show_raw_section:
-        try:
-            raw_pretty = json.dumps(raw_obj, indent=2, default=str)
-        except Exception:
-            raw_pretty = str(raw_obj)
+        raw_pretty = _raw_pretty(raw_obj)
         raw_section = html.Details([
             html.Summary("Raw JSON"),
             html.Div([
@@ -1,42 +1,34 @@
-from typing import Dict, List
-import os
+from functools import lru_cache
+from typing import Dict, List, Tuple
 from dash import html
+import plotly.io as pio
 import Graph
-from Nodes import find_nodes
-import json as _json
-import difflib
+from Nodes import load_snapshot_nodes, snapshot_signature
+from FastJson import dumps_pretty, loads as json_loads
+import sys
 
+try:
+    # C implementation of difflib's matcher; same get_opcodes() contract
+    from cdifflib import CSequenceMatcher as SequenceMatcher
+except ImportError:
+    from difflib import SequenceMatcher
 
-def _load_nodes(snapshot: str) -> Dict[str, dict]:
-    """Load nodes for a snapshot into a dict keyed by node name."""
-    folder = os.path.join("Snapshots", snapshot)
-    files = [f for f in os.listdir(folder) if f.endswith('.json')]
-    nodes = find_nodes(files, folder)
-    by_name = {n['name']: n for n in nodes}
-    return by_name
 
+@lru_cache(maxsize=8)
+def _load_nodes(snapshot: str, signature: int) -> Dict[str, dict]:
+    """Index a snapshot version's shared primary nodes (Nodes.load_snapshot_nodes) by node name."""
+    return {n['name']: n for n in load_snapshot_nodes(snapshot, signature)}
 
-def _classify_diff(a_node: dict | None, b_node: dict | None) -> str:
-    """Return 'distinct', 'same', or 'changed' comparing two node entries by name.
-    Distinct: present in one side only.
+
+def _diff_key(node: dict) -> Tuple[bool, str]:
+    """Return the part of a node that decides whether it 'changed' between snapshots.
     Same: present in both and JSON/primary-ness equivalent.
     Changed: present in both but JSON differs or primary/secondary status differs.
+    (Distinct, present in one side only, is decided by set membership in build_compare.)
     """
-    if a_node is None or b_node is None:
-        return 'distinct'
-
-    # If one is primary and the other is secondary, treat as changed
-    a_primary = (a_node.get('order') == 'primary') and bool(a_node.get('json'))
-    b_primary = (b_node.get('order') == 'primary') and bool(b_node.get('json'))
-    if a_primary != b_primary:
-        return 'changed'
-
-    a_json = a_node.get('json') or ''
-    b_json = b_node.get('json') or ''
-    if a_json == b_json:
-        return 'same'
-    else:
-        return 'changed'
+    json_str = node.get('json') or ''
+    is_primary = (node.get('order') == 'primary') and bool(json_str)
+    return is_primary, json_str
 
 
 def _pretty(n: str) -> str:
@@ -48,53 +40,84 @@ def _pretty(n: str) -> str:
         return n
 
 
+_DEPTH_PLACEHOLDER = "<… depth limit …>"
+
+
+def _exceeds_depth(val, max_depth: int) -> bool:
+    """Return True if any value inside val sits at depth >= max_depth (val itself is depth 0)."""
+    if max_depth <= 0:
+        return True
+    stack = [(val, 0)]
+    while stack:
+        cur, depth = stack.pop()
+        if isinstance(cur, dict):
+            children = cur.values()
+        elif isinstance(cur, list):
+            children = cur
+        else:
+            continue
+        if depth + 1 >= max_depth:
+            if children:
+                return True
+            continue
+        stack.extend((child, depth + 1) for child in children if isinstance(child, (dict, list)))
+    return False
+
+
 def _truncate_depth(val, depth: int, max_depth: int):
-    """Recursively copy the structure, replacing values deeper than max_depth with a placeholder."""
-    if depth >= max_depth:
-        return "<… depth limit …>"
-    if isinstance(val, dict):
-        # keep keys sorted for stable output
-        return {k: _truncate_depth(val[k], depth + 1, max_depth) for k in sorted(val.keys())}
-    if isinstance(val, list):
-        return [_truncate_depth(v, depth + 1, max_depth) for v in val]
-    if isinstance(val, tuple):
-        return tuple(_truncate_depth(v, depth + 1, max_depth) for v in val)
-    return val
+    """Copy the structure, replacing values at depth >= max_depth with a placeholder.
+    Returns val itself (no copy) when nothing is deep enough to be truncated.
+    Key order is left to the serializer's sort_keys.
+    """
+    if not _exceeds_depth(val, max_depth - depth):
+        return val
+    if depth >= max_depth or not isinstance(val, (dict, list)):
+        return _DEPTH_PLACEHOLDER
+
+    out = {} if isinstance(val, dict) else []
+    stack = [(val, out, depth)]
+    while stack:
+        src, dst, d = stack.pop()
+        items = src.items() if isinstance(src, dict) else enumerate(src)
+        for k, v in items:
+            if d + 1 >= max_depth:
+                child = _DEPTH_PLACEHOLDER
+            elif isinstance(v, (dict, list)):
+                child = {} if isinstance(v, dict) else []
+                stack.append((v, child, d + 1))
+            else:
+                child = v
+            if isinstance(dst, dict):
+                dst[k] = child
+            else:
+                dst.append(child)
+    return out
 
 
 def _node_json_pretty(node: dict | None, max_depth: int = 10) -> str:
     if not node:
         return ""
     raw = node.get('raw')
+    if raw is None:
+        # Secondary nodes only carry the prebuilt string; nothing to re-serialize
+        return node.get('json') or ""
+    # Not memoized here: nodes are shared read-only, and _node_diff already caches each node pair's diff
     try:
-        if raw is not None:
-            truncated = _truncate_depth(raw, 0, max_depth)
-            return _json.dumps(truncated, indent=2, sort_keys=True)
+        truncated = _truncate_depth(raw, 0, max_depth)
+        return dumps_pretty(truncated, sort_keys=True)
     except Exception:
-        pass
-    # fallback to whatever string we had
-    val = node.get('json') or ""
-    return val
-
-
-def _leading_spaces(s: str) -> int:
-    cnt = 0
-    for ch in s:
-        if ch == ' ':
-            cnt += 1
-        else:
-            break
-    return cnt
+        # fallback to whatever string we had
+        return node.get('json') or ""
 
 
 def _dedent_block(block: List[str]) -> List[str]:
     """Remove the minimum common leading spaces from non-empty lines in a block.
     Preserves relative indentation (depth) while making the block flush-left in its column.
     """
-    non_empty = [ln for ln in block if ln.strip() != ""]
-    if not non_empty:
+    indents = [len(ln) - len(ln.lstrip(' ')) for ln in block if ln.strip()]
+    if not indents:
         return block
-    min_indent = min(_leading_spaces(ln) for ln in non_empty)
+    min_indent = min(indents)
     if min_indent <= 0:
         return block
     return [ln[min_indent:] if len(ln) >= min_indent else ln for ln in block]
@@ -105,25 +128,19 @@ def _two_column_diff(a_text: str, b_text: str, left_label: str | None = None, ri
     Changed blocks are dedented to align like prettified JSON (flush-left within each column).
     Includes optional column labels.
     """
-    a_lines = a_text.splitlines()
-    b_lines = b_text.splitlines()
-    sm = difflib.SequenceMatcher(a=a_lines, b=b_lines)
-
-    left_col_children: List[html.Div] = []
-    right_col_children: List[html.Div] = []
-
-    base_style = {
-        'fontFamily': 'ui-monospace, SFMono-Regular, Menlo, Monaco, Consolas, "Liberation Mono", "Courier New", monospace',
-        'fontSize': '12px',
-        'whiteSpace': 'pre',
-        'padding': '1px 0px',
-        'borderBottom': '1px solid #f0f0f0',
-        'text-align': 'left'
-    }
-    add_style = {**base_style, 'backgroundColor': '#e6ffed', 'color': '#22863a'}  # green
-    del_style = {**base_style, 'backgroundColor': '#ffeef0', 'color': '#cb2431'}  # red
-    eq_style = {**base_style}
-    empty_style = {**base_style, 'color': '#999'}
+    # Intern lines so the matcher's hashing/equality on repeated JSON lines is pointer-cheap.
+    # autojunk=False: JSON repeats punctuation lines ("},", "]") far past the 1% popularity cutoff,
+    # and junking them makes the matcher fall back to poor, oversized replace blocks.
+    a_lines = [sys.intern(ln) for ln in a_text.splitlines()]
+    b_lines = [sys.intern(ln) for ln in b_text.splitlines()]
+    sm = SequenceMatcher(a=a_lines, b=b_lines, autojunk=False)
+
+    left_lines: List[html.Span] = []
+    right_lines: List[html.Span] = []
+
+    # One lightweight span per line; colors/spacing come from the diff-* classes in styles.css
+    def line(text: str, cls: str) -> html.Span:
+        return html.Span(text, className=f"diff-line {cls if text != '' else 'diff-empty'}")
 
     for tag, i1, i2, j1, j2 in sm.get_opcodes():
         if tag == 'equal':
@@ -132,54 +149,33 @@ def _two_column_diff(a_text: str, b_text: str, left_label: str | None = None, ri
             right_block = _dedent_block(b_lines[j1:j2])
             height = max(len(left_block), len(right_block))
             for idx in range(height):
-                ltxt = left_block[idx] if idx < len(left_block) else ""
-                rtxt = right_block[idx] if idx < len(right_block) else ""
-                left_col_children.append(html.Div(ltxt if ltxt != "" else "", style=(eq_style if ltxt != "" else empty_style)))
-                right_col_children.append(html.Div(rtxt if rtxt != "" else "", style=(eq_style if rtxt != "" else empty_style)))
+                left_lines.append(line(left_block[idx] if idx < len(left_block) else "", 'diff-eq'))
+                right_lines.append(line(right_block[idx] if idx < len(right_block) else "", 'diff-eq'))
         elif tag == 'replace':
             # Dedent both sides to align like prettified JSON
             left_block = _dedent_block(a_lines[i1:i2])
             right_block = _dedent_block(b_lines[j1:j2])
             height = max(len(left_block), len(right_block))
             for idx in range(height):
-                ltxt = left_block[idx] if idx < len(left_block) else ""
-                rtxt = right_block[idx] if idx < len(right_block) else ""
-                left_col_children.append(html.Div(ltxt if ltxt != "" else "", style=(del_style if ltxt != "" else empty_style)))
-                right_col_children.append(html.Div(rtxt if rtxt != "" else "", style=(add_style if rtxt != "" else empty_style)))
+                left_lines.append(line(left_block[idx] if idx < len(left_block) else "", 'diff-del'))
+                right_lines.append(line(right_block[idx] if idx < len(right_block) else "", 'diff-add'))
         elif tag == 'delete':
             left_block = _dedent_block(a_lines[i1:i2])
-            for k in range(len(left_block)):
-                left_col_children.append(html.Div(left_block[k], style=del_style))
-            for _ in range(len(left_block)):
-                right_col_children.append(html.Div("", style=empty_style))
+            for ltxt in left_block:
+                left_lines.append(line(ltxt, 'diff-del'))
+                right_lines.append(line("", 'diff-add'))
         elif tag == 'insert':
             right_block = _dedent_block(b_lines[j1:j2])
-            for _ in range(len(right_block)):
-                left_col_children.append(html.Div("", style=empty_style))
-            for k in range(len(right_block)):
-                right_col_children.append(html.Div(right_block[k], style=add_style))
-
-    header_style = {
-        'fontWeight': 600,
-        'padding': '4px 0px',
-        'borderBottom': '1px solid #e1e4e8',
-        'backgroundColor': '#f8f9fa'
-    }
+            for rtxt in right_block:
+                left_lines.append(line("", 'diff-del'))
+                right_lines.append(line(rtxt, 'diff-add'))
 
     container = html.Div([
-        html.Div(left_label or "Snapshot A", style=header_style),
-        html.Div(right_label or "Snapshot B", style=header_style),
-        html.Div(left_col_children, style={'overflowX': 'auto'}),
-        html.Div(right_col_children, style={'overflowX': 'auto'})
-    ], style={
-        'display': 'grid',
-        'gridTemplateColumns': '1fr 1fr',
-        'gridAutoRows': 'auto',
-        'columnGap': '8px',
-        'border': '1px solid #e1e4e8',
-        'borderRadius': '6px',
-        'backgroundColor': '#fff'
-    })
+        html.Div(left_label or "Snapshot A", className="diff-header"),
+        html.Div(right_label or "Snapshot B", className="diff-header"),
+        html.Pre(left_lines, className="diff-col"),
+        html.Pre(right_lines, className="diff-col")
+    ], className="diff-grid")
     return container
 
 
@@ -187,52 +183,79 @@ def build_compare(snapshot_a: str, snapshot_b: str):
     """Build side-by-side compare figures and a differences list for two snapshots.
 
     Returns: (fig_a, fig_b, diff_children)
-    - fig_a: plotly figure for snapshot A with borders colored by diff status
-    - fig_b: plotly figure for snapshot B with borders colored by diff status
+    - fig_a: figure dict for snapshot A with borders colored by diff status
+    - fig_b: figure dict for snapshot B with borders colored by diff status
     - diff_children: Dash HTML children summarizing adds/removes/changes
+    Callers needing only one part should use build_compare_figures / build_compare_diff.
+    """
+    fig_a, fig_b = build_compare_figures(snapshot_a, snapshot_b)
+    return fig_a, fig_b, build_compare_diff(snapshot_a, snapshot_b)
+
+
+def build_compare_figures(snapshot_a: str, snapshot_b: str):
+    """Return (fig_a, fig_b) as pre-serialized figure dicts, memoized per snapshot pair until either snapshot
+    changes on disk. Cache hits hand Dash plain JSON types, skipping Plotly's figure walk.
     """
-    a_nodes = _load_nodes(snapshot_a)
-    b_nodes = _load_nodes(snapshot_b)
+    return _compare_figures(snapshot_a, snapshot_b, snapshot_signature(snapshot_a), snapshot_signature(snapshot_b))
+
+
+def build_compare_diff(snapshot_a: str, snapshot_b: str) -> html.Div:
+    """Return the differences panel, memoized per snapshot pair until either snapshot changes on disk."""
+    return _compare_diff_children(snapshot_a, snapshot_b, snapshot_signature(snapshot_a), snapshot_signature(snapshot_b))
+
+
+def build_node_diff(snapshot_a: str, snapshot_b: str, name: str) -> html.Div:
+    """Return the two-column diff for one changed node, memoized until either snapshot changes on disk."""
+    return _node_diff(snapshot_a, snapshot_b, snapshot_signature(snapshot_a), snapshot_signature(snapshot_b), name)
+
+
+# The sig_a/sig_b arguments of the cached helpers below are only part of the cache key.
+
+@lru_cache(maxsize=32)
+def _compare_data(snapshot_a: str, snapshot_b: str, sig_a: int, sig_b: int):
+    """Classify nodes of two snapshots.
+    Returns (a_borders, b_borders, added_in_a, added_in_b, changed); shared cached objects, do not mutate.
+    """
+    a_nodes = _load_nodes(snapshot_a, sig_a)
+    b_nodes = _load_nodes(snapshot_b, sig_b)
 
     a_names = set(a_nodes.keys())
     b_names = set(b_nodes.keys())
-    all_names = sorted(a_names | b_names)
+    both = a_names & b_names
+
+    added_in_a: List[str] = sorted(a_names - b_names)  # present only in A
+    added_in_b: List[str] = sorted(b_names - a_names)  # present only in B
+    changed: List[str] = [n for n in sorted(both) if _diff_key(a_nodes[n]) != _diff_key(b_nodes[n])]  # present in both but different
 
     # Build border override maps for each figure
-    a_borders: Dict[str, str] = {}
-    b_borders: Dict[str, str] = {}
-
-    added_in_b: List[str] = []  # present only in B
-    added_in_a: List[str] = []  # present only in A
-    changed: List[str] = []  # present in both but different
-
-    for name in all_names:
-        a_node = a_nodes.get(name)
-        b_node = b_nodes.get(name)
-        status = _classify_diff(a_node, b_node)
-
-        if status == 'distinct':
-            if a_node and not b_node:
-                a_borders[name] = 'distinct'
-                added_in_a.append(name)
-            elif b_node and not a_node:
-                b_borders[name] = 'distinct'
-                added_in_b.append(name)
-            else:
-                # Shouldn't happen, but default to distinct both
-                a_borders[name] = 'distinct'
-                b_borders[name] = 'distinct'
-        elif status == 'same':
-            a_borders[name] = 'same'
-            b_borders[name] = 'same'
-        elif status == 'changed':
-            a_borders[name] = 'changed'
-            b_borders[name] = 'changed'
-            changed.append(name)
+    both_borders: Dict[str, str] = dict.fromkeys(both, 'same')
+    both_borders.update(dict.fromkeys(changed, 'changed'))
+    a_borders: Dict[str, str] = {**both_borders, **dict.fromkeys(added_in_a, 'distinct')}
+    b_borders: Dict[str, str] = {**both_borders, **dict.fromkeys(added_in_b, 'distinct')}
+
+    return a_borders, b_borders, added_in_a, added_in_b, changed
+
+
+@lru_cache(maxsize=32)
+def _compare_figures(snapshot_a: str, snapshot_b: str, sig_a: int, sig_b: int):
+    a_borders, b_borders, _, _, _ = _compare_data(snapshot_a, snapshot_b, sig_a, sig_b)
 
     # Create figures using Graph with border overrides (primary nodes only)
     fig_a = Graph.create_network_graph(snapshot_a, border_override=a_borders, include_secondary=False)
     fig_b = Graph.create_network_graph(snapshot_b, border_override=b_borders, include_secondary=False)
+    return _figure_json(fig_a), _figure_json(fig_b)
+
+
+def _figure_json(fig):
+    """Serialize a figure to plain JSON types; a snapshot without nodes (fig None) gives an empty figure."""
+    if fig is None:
+        return {}
+    return json_loads(pio.to_json(fig, validate=False))
+
+
+@lru_cache(maxsize=32)
+def _compare_diff_children(snapshot_a: str, snapshot_b: str, sig_a: int, sig_b: int) -> html.Div:
+    _, _, added_in_a, added_in_b, changed = _compare_data(snapshot_a, snapshot_b, sig_a, sig_b)
 
     # Build differences UI
     unique_to_b_section = html.Div([
@@ -251,15 +274,13 @@ def build_compare(snapshot_a: str, snapshot_b: str):
         unique_to_b_section
     ], className="two-col")
 
-    # Changed section with details and two-column diff
+    # Changed section with details; each two-column diff is filled in by a callback on the first click
     changed_sections: List[html.Details] = []
     for n in changed:
-        a_text = _node_json_pretty(a_nodes.get(n), max_depth=10)
-        b_text = _node_json_pretty(b_nodes.get(n), max_depth=10)
         details = html.Details([
             html.Summary(n),
-            html.Div(_two_column_diff(a_text, b_text, left_label=f"{snapshot_a}", right_label=f"{snapshot_b}"), style={'marginTop': '6px'})
-        ], open=False)
+            html.Div(id={'type': 'diff-slot', 'name': n}, className="diff-body")
+        ], id={'type': 'diff-details', 'name': n}, open=False)
         changed_sections.append(details)
 
     changed_section = html.Div([
@@ -267,6 +288,11 @@ def build_compare(snapshot_a: str, snapshot_b: str):
         html.Div(changed_sections or [html.Div("None")])
     ])
 
-    diff_children = html.Div([changed_section, unique_two_col])
+    return html.Div([changed_section, unique_two_col])
+
 
-    return fig_a, fig_b, diff_children
+@lru_cache(maxsize=256)
+def _node_diff(snapshot_a: str, snapshot_b: str, sig_a: int, sig_b: int, name: str) -> html.Div:
+    a_text = _node_json_pretty(_load_nodes(snapshot_a, sig_a).get(name), max_depth=10)
+    b_text = _node_json_pretty(_load_nodes(snapshot_b, sig_b).get(name), max_depth=10)
+    return _two_column_diff(a_text, b_text, left_label=f"{snapshot_a}", right_label=f"{snapshot_b}")
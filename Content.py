@@ -1,178 +1,246 @@
 import csv
+import gzip
+import io
 import os
-
-from Nodes import find_nodes
+import zipfile
+
+from dash import dcc
+
+from Nodes import list_json_files, load_snapshot_nodes, snapshot_mtime
+
+
+def _message_row(node):
+    return (
+        node['name'],
+        node['program'],
+        node['display_name'],
+        node['content'][1],  # subject
+        node['content'][0],  # body
+        node['content'][2],  # notification text
+        ';'.join(node['connections'])
+    )
+
+
+def _incentive_row(node):
+    return (
+        node['name'],
+        node['program'],
+        node['display_name'],
+        node['content'][0],
+        node['content'][1],
+        ';'.join(node['connections'])
+    )
+
+
+def _custom_field_row(node):
+    return (
+        node['name'],
+        node['program'],
+        node['display_name'],
+        node['content'][0],
+        node['content'][1],
+        node['content'][2] if node['content'][2] is not None else "None",
+        ';'.join(node['connections'])
+    )
+
+
+def _page_layout_row(node):
+    return (
+        node['name'],
+        node['program'],
+        node['display_name'],
+        node['content'] if node['content'] is not None else "None",
+        ';'.join(node['connections'])
+    )
+
+
+# Node class -> (file name suffix, status label, header row, row builder).
+# Page layouts carry the largest HTML payloads, so that export is gzip-compressed.
+CSV_EXPORTS = {
+    "Incentive": ("incentives.csv", "Incentive",
+                  ["Identification", "Program", "System Name", "Display Name", "Content", "References"],
+                  _incentive_row),
+    "MessageConfig": ("messages.csv", "Message",
+                      ["Identification", "Program", "System Name", "Subject", "Body", "Notification Text",
+                       "References"],
+                      _message_row),
+    "CustomFieldDef": ("custom_fields.csv", "Custom fields",
+                       ["Identification", "Program", "System Name", "Class Type", "Field Type", "Default Value",
+                        "References"],
+                       _custom_field_row),
+    "ClientPageLayout": ("page_layouts.csv.gz", "Page layout",
+                         ["Identification", "Program", "System Name", "HTML Content", "References"],
+                         _page_layout_row),
+}
+
+
+# Per-export stamps "<snapshot signature> <export mtime>"; an export whose stamp still matches is reused as is
+_EXPORT_STAMP_DIR = os.path.join(".cache", "exports")
+
+
+def _stamp_path(export_path):
+    return os.path.join(_EXPORT_STAMP_DIR, os.path.basename(export_path) + ".stamp")
+
+
+def _is_fresh(export_path, signature):
+    """True if export_path was written from this snapshot version and has not been touched since."""
+    try:
+        with open(_stamp_path(export_path), encoding='utf-8') as f:
+            return f.read() == f"{signature} {os.stat(export_path).st_mtime_ns}"
+    except OSError:
+        return False
 
 
-def download_message_content_as_csv(n_clicks, selected_snapshot):
-    if not n_clicks:
-        return None
-    print("Download Message Content clicked")
-    if not selected_snapshot:
-        return "Please select a snapshot before downloading."
+def _write_stamp(export_path, signature):
     try:
-        snapshot_folder = os.path.join("Snapshots", selected_snapshot)
-        json_files = [f for f in os.listdir(snapshot_folder) if f.endswith('.json')]
-        nodes = find_nodes(json_files, snapshot_folder)
-
-        # Delete Old CSV file if it exists
-        csv_file_path = os.path.join("Content", f"{selected_snapshot}_messages.csv")
-        if os.path.exists(csv_file_path):
-            os.remove(csv_file_path)
-            print(f"Removed old CSV file: {csv_file_path}")
-
-        # Write message content to csv file using proper CSV writer
-        with open(os.path.join("Content", f"{selected_snapshot}_messages.csv"), "w", newline='',
-                  encoding='utf-8') as f:
+        os.makedirs(_EXPORT_STAMP_DIR, exist_ok=True)
+        with open(_stamp_path(export_path), "w", encoding='utf-8') as f:
+            f.write(f"{signature} {os.stat(export_path).st_mtime_ns}")
+    except OSError as e:
+        print(f"Could not record export stamp for {export_path}: {e}")
+
+
+def _export_path(selected_snapshot, node_class):
+    return os.path.join("Content", f"{selected_snapshot}_{CSV_EXPORTS[node_class][0]}")
+
+
+# Exports are written through a 1 MiB buffer so rows reach the file (or the compressor) in a few large writes
+_CSV_BUFFER_SIZE = 1 << 20
+
+
+class _GzipExport(gzip.GzipFile):
+    """Gzip writer for a temporary export file whose header records the final export name, so gunzip -N and
+    7-Zip extract it as <snapshot>_page_layouts.csv rather than a .tmp name. Closing it also closes the file.
+    """
+
+    def __init__(self, tmp_path, export_path):
+        # compresslevel=1 keeps gzip cheap on CPU while still shrinking HTML-heavy rows several-fold
+        super().__init__(filename=os.path.basename(export_path), mode="wb", fileobj=open(tmp_path, "wb"),
+                         compresslevel=1)
+        self._target = self.fileobj
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self._target.close()
+
+
+def _open_csv(tmp_path, export_path):
+    """Open tmp_path for writing export_path's rows, gzip-compressed when the export name ends in .gz."""
+    if export_path.endswith(".gz"):
+        raw = io.BufferedWriter(_GzipExport(tmp_path, export_path), buffer_size=_CSV_BUFFER_SIZE)
+        return io.TextIOWrapper(raw, newline='', encoding='utf-8')
+    return open(tmp_path, "w", newline='', encoding='utf-8', buffering=_CSV_BUFFER_SIZE)
+
+
+def _export_csv(selected_snapshot, node_classes, progress=None):
+    """Write one CSV per requested node class from a single pass over the snapshot's nodes.
+    Rows stream straight into temporary files that replace the exports only once every row was written,
+    so a bad node never leaves a truncated CSV behind. Exports already written from the current snapshot
+    version are kept, and the snapshot is not parsed at all when every export is current.
+    progress, if given, is called with short status strings as the export advances.
+    Returns the file paths in the order of node_classes.
+    """
+    snapshot_folder = os.path.join("Snapshots", selected_snapshot)
+    json_files = list_json_files(snapshot_folder)
+    signature = snapshot_mtime(snapshot_folder, json_files)
+
+    paths = [_export_path(selected_snapshot, node_class) for node_class in node_classes]
+    stale = [(node_class, path) for node_class, path in zip(node_classes, paths) if not _is_fresh(path, signature)]
+    if not stale:
+        print(f"Reusing current exports for {selected_snapshot}")
+        return paths
+
+    if progress:
+        progress(f"Reading snapshot {selected_snapshot}...")
+    nodes = load_snapshot_nodes(selected_snapshot, signature)
+    if progress:
+        progress(f"Writing {', '.join(CSV_EXPORTS[node_class][1].lower() for node_class, _path in stale)} content...")
+    by_class = {node_class: [] for node_class, _path in stale}
+    for node in nodes:
+        class_nodes = by_class.get(node['class'])
+        if class_nodes is not None:
+            class_nodes.append(node)
+    files = {}
+    try:
+        for node_class, path in stale:
+            f = files[node_class] = _open_csv(path + ".tmp", path)
             writer = csv.writer(f)
-            writer.writerow(
-                ["Identification", "Program", "System Name", "Subject", "Body", "Notification Text",
-                 "References"])
-            for node in nodes:
-                if node['class'] == "MessageConfig":
-                    writer.writerow([
-                        node['name'],
-                        node['program'],
-                        node['display_name'],
-                        node['content'][1],  # subject
-                        node['content'][0],  # body
-                        node['content'][2],  # notification text
-                        ';'.join(node['connections'])
-                    ])
-        msg = f"Message content downloaded to {os.path.join('Content', f'{selected_snapshot}_messages.csv')}"
-        print(msg)
-        return msg
-    except Exception as e:
-        err = f"Error writing message content: {e}"
-        print(err)
-        return err
-
-
-def download_incentive_content_as_csv(n_clicks, selected_snapshot):
+            writer.writerow(CSV_EXPORTS[node_class][2])
+            writer.writerows(map(CSV_EXPORTS[node_class][3], by_class[node_class]))
+    except BaseException:
+        for node_class, f in files.items():
+            f.close()
+            os.remove(_export_path(selected_snapshot, node_class) + ".tmp")
+        raise
+    for f, (_node_class, path) in zip(files.values(), stale):
+        f.close()
+        os.replace(path + ".tmp", path)
+        _write_stamp(path, signature)
+    return paths
+
+
+def _zip_exports(selected_snapshot, paths):
+    """Bundle exported files into one archive for a single browser download."""
+    zip_path = os.path.join("Content", f"{selected_snapshot}_content.zip")
+    with zipfile.ZipFile(zip_path + ".tmp", "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1) as archive:
+        for path in paths:
+            archive.write(path, arcname=os.path.basename(path))
+    os.replace(zip_path + ".tmp", zip_path)
+    return zip_path
+
+
+def _download_content_as_csv(n_clicks, selected_snapshot, node_class, progress=None):
+    """Export one node class. Returns (status message, dcc.Download data or None)."""
     if not n_clicks:
-        return None
-    print("Download Incentive Content clicked")
+        return None, None
+    label = CSV_EXPORTS[node_class][1]
+    print(f"Download {label.title()} Content clicked")
     if not selected_snapshot:
-        return "Please select a snapshot before downloading."
+        return "Please select a snapshot before downloading.", None
     try:
-        snapshot_folder = os.path.join("Snapshots", selected_snapshot)
-        json_files = [f for f in os.listdir(snapshot_folder) if f.endswith('.json')]
-        nodes = find_nodes(json_files, snapshot_folder)
-
-        # Delete Old CSV file if it exists
-        csv_file_path = os.path.join("Content", f"{selected_snapshot}_incentives.csv")
-        if os.path.exists(csv_file_path):
-            os.remove(csv_file_path)
-            print(f"Removed old CSV file: {csv_file_path}")
-
-        # Write incentive content to csv file using proper CSV writer
-        with open(os.path.join("Content", f"{selected_snapshot}_incentives.csv"), "w", newline='',
-                  encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow(
-                ["Identification", "Program", "System Name", "Display Name", "Content", "References"])
-
-            for node in nodes:
-                if node['class'] == "Incentive":
-                    writer.writerow([
-                        node['name'],
-                        node['program'],
-                        node['display_name'],
-                        node['content'][0],
-                        node['content'][1],
-                        ';'.join(node['connections'])
-                    ])
-        msg = f"Incentive content downloaded to {os.path.join('Content', f'{selected_snapshot}_incentives.csv')}"
+        csv_file_path, = _export_csv(selected_snapshot, [node_class], progress)
+        msg = f"{label} content downloaded to {csv_file_path}"
         print(msg)
-        return msg
+        return msg, dcc.send_file(csv_file_path)
     except Exception as e:
-        err = f"Error writing incentive content: {e}"
+        err = f"Error writing {label.lower()} content: {e}"
         print(err)
-        return err
+        return err, None
 
 
-def download_client_custom_fields_content_as_csv(n_clicks, selected_snapshot):
-    if not n_clicks:
-        return None
-    print("Download Custom Fields Content clicked")
-    if not selected_snapshot:
-        return "Please select a snapshot before downloading."
-    try:
-        snapshot_folder = os.path.join("Snapshots", selected_snapshot)
-        json_files = [f for f in os.listdir(snapshot_folder) if f.endswith('.json')]
-        nodes = find_nodes(json_files, snapshot_folder)
-
-        # Delete Old CSV file if it exists
-        csv_file_path = os.path.join("Content", f"{selected_snapshot}_custom_fields.csv")
-        if os.path.exists(csv_file_path):
-            os.remove(csv_file_path)
-            print(f"Removed old CSV file: {csv_file_path}")
-
-        # Write custom fields content to csv file using proper CSV writer
-        with open(os.path.join("Content", f"{selected_snapshot}_custom_fields.csv"), "w", newline='',
-                  encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow(
-                ["Identification", "Program", "System Name", "Class Type", "Field Type", "Default Value",
-                 "References"])
-
-            for node in nodes:
-                if node['class'] == "CustomFieldDef":
-                    writer.writerow([
-                        node['name'],
-                        node['program'],
-                        node['display_name'],
-                        node['content'][0],
-                        node['content'][1],
-                        node['content'][2] if node['content'][2] is not None else "None",
-                        ';'.join(node['connections'])
-                    ])
-        msg = f"Custom fields content downloaded to {os.path.join('Content', f'{selected_snapshot}_custom_fields.csv')}"
-        print(msg)
-        return msg
-    except Exception as e:
-        err = f"Error writing custom fields content: {e}"
-        print(err)
-        return err
+def download_message_content_as_csv(n_clicks, selected_snapshot, progress=None):
+    return _download_content_as_csv(n_clicks, selected_snapshot, "MessageConfig", progress)
+
 
+def download_incentive_content_as_csv(n_clicks, selected_snapshot, progress=None):
+    return _download_content_as_csv(n_clicks, selected_snapshot, "Incentive", progress)
 
-def download_client_page_layout_content_as_csv(n_clicks, selected_snapshot):
+
+def download_client_custom_fields_content_as_csv(n_clicks, selected_snapshot, progress=None):
+    return _download_content_as_csv(n_clicks, selected_snapshot, "CustomFieldDef", progress)
+
+
+def download_client_page_layout_content_as_csv(n_clicks, selected_snapshot, progress=None):
+    return _download_content_as_csv(n_clicks, selected_snapshot, "ClientPageLayout", progress)
+
+
+def download_all_content_as_csv(n_clicks, selected_snapshot, progress=None):
+    """Export every content CSV while reading the snapshot only once; the browser gets them as one zip."""
     if not n_clicks:
-        return None
-    print("Download Page Layout Content clicked")
+        return None, None
+    print("Download All Content clicked")
     if not selected_snapshot:
-        return "Please select a snapshot before downloading."
+        return "Please select a snapshot before downloading.", None
     try:
-        snapshot_folder = os.path.join("Snapshots", selected_snapshot)
-        json_files = [f for f in os.listdir(snapshot_folder) if f.endswith('.json')]
-        nodes = find_nodes(json_files, snapshot_folder)
-
-        # Delete Old CSV file if it exists
-        csv_file_path = os.path.join("Content", f"{selected_snapshot}_page_layouts.csv")
-        if os.path.exists(csv_file_path):
-            os.remove(csv_file_path)
-            print(f"Removed old CSV file: {csv_file_path}")
-
-        # Write page layout content to csv file using proper CSV writer
-        with open(os.path.join("Content", f"{selected_snapshot}_page_layouts.csv"), "w", newline='',
-                  encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow(
-                ["Identification", "Program", "System Name", "HTML Content", "References"])
-
-            for node in nodes:
-                if node['class'] == "ClientPageLayout":
-                    writer.writerow([
-                        node['name'],
-                        node['program'],
-                        node['display_name'],
-                        node['content'] if node['content'] is not None else "None",
-                        ';'.join(node['connections'])
-                    ])
-        msg = f"Page layout content downloaded to {os.path.join('Content', f'{selected_snapshot}_page_layouts.csv')}"
+        paths = _export_csv(selected_snapshot, list(CSV_EXPORTS), progress)
+        msg = f"All content downloaded to {', '.join(paths)}"
         print(msg)
-        return msg
+        if progress:
+            progress("Zipping exports...")
+        return msg, dcc.send_file(_zip_exports(selected_snapshot, paths))
     except Exception as e:
-        err = f"Error writing page layout content: {e}"
+        err = f"Error writing content: {e}"
         print(err)
-        return err
+        return err, None
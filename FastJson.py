@@ -0,0 +1,32 @@
+import json
+
+# orjson is an optional speedup; everything here falls back to the standard library
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps_pretty(obj, sort_keys=False):
+    """Serialize obj as 2-space indented JSON text, converting unknown types with str()."""
+    if orjson is not None:
+        option = orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, option=option, default=str).decode()
+        except TypeError:
+            # e.g. integers wider than 64 bits; the stdlib encoder handles those
+            pass
+    return json.dumps(obj, indent=2, sort_keys=sort_keys, default=str)
+
+
+def loads(data):
+    """Parse JSON from bytes or str."""
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # orjson is strict (no NaN/Infinity, 64-bit integers); let the stdlib decide
+            pass
+    return json.loads(data)
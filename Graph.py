@@ -1,12 +1,59 @@
 import os
 import networkx as nx
-from Nodes import find_nodes, create_secondary_nodes
+import numpy as np
+from Nodes import create_secondary_nodes, list_json_files, load_snapshot_nodes, snapshot_mtime
+from Layout import cluster_layouts
 import plotly.graph_objects as go
 import math
 import re
-
-
-def create_network_graph(snapshot_folder_name, include_classes=None, include_programs=None, name_contains=None, highlight_json_contains=None, highlight_content_contains=None, border_override=None, include_secondary=True):
+import hashlib
+import pickle
+import sys
+import threading
+from collections import OrderedDict
+
+
+# Define colors for different node types
+CLASS_COLORS = {
+    'MessageConfig': '#1f77b4',
+    'ClientTopic': '#ff7f0e',
+    'StandaloneFormula': '#2ca02c',
+    'ClientPageLayout': '#d62728',
+    'CustomFieldDef': '#bcbd22',
+    'ClientProgram': '#17becf',
+    'MessageCategory': '#9467bd',
+    'Incentive': '#8c564b',
+    'ClientRaffle': '#e377c2',
+    'ClientReward': '#7f7f7f',
+    'ClientTaskHandlerDefinition': '#ff9896',
+    'Rule': '#e377c2',
+    'RuleSet': '#7f7f7f',
+    'default': '#17becf'
+}
+# Type -> palette row. Node markers carry these small integer ids instead of colour strings (Plotly
+# validates a string colour array element by element, a numeric one in bulk), and a stepped colorscale
+# over cmin=0..cmax maps id i exactly to the i-th colour
+_COLOR_INDEX = {class_name: i for i, class_name in enumerate(CLASS_COLORS)}
+_DEFAULT_COLOR_INDEX = _COLOR_INDEX['default']
+_MARKER_COLORSCALE = dict(
+    colorscale=[[i / (len(CLASS_COLORS) - 1), color] for i, color in enumerate(CLASS_COLORS.values())],
+    cmin=0,
+    cmax=len(CLASS_COLORS) - 1
+)
+
+# Node traces switch from SVG to WebGL above this many nodes
+_WEBGL_NODE_MIN = 2000
+# Level of detail: graphs with more nodes than this draw each collapsed program as a single node
+_LOD_NODE_MIN = 2000
+# customdata prefix of those program nodes; real node names always start with "<<"
+CLUSTER_PREFIX = "cluster:"
+# Node border colour per highlight outcome
+_HIGHLIGHT_BORDERS = {'matched': '#2ecc71', 'not_matched': '#e74c3c', 'na': '#000000'}
+# Characters that give a highlight pattern regex meaning; patterns without them are plain substrings
+_REGEX_META = frozenset('.^$*+?{}[]\\|()')
+
+
+def create_network_graph(snapshot_folder_name, include_classes=None, include_programs=None, name_contains=None, highlight_json_contains=None, highlight_content_contains=None, border_override=None, include_secondary=True, expanded_programs=None):
     """Create a network graph from the JSON configuration files, grouped by program.
     include_classes: optional list of class/type names to include. If None, include all.
     include_programs: optional list of program names to include. If None, include all.
@@ -18,6 +65,9 @@ def create_network_graph(snapshot_folder_name, include_classes=None, include_pro
                                 will be highlighted green if they match, red if they don't. Nodes without content are black.
     border_override: optional dict mapping node name -> one of {'same','distinct','changed'} to control border colors for compare views.
     include_secondary: when True (default) include implied secondary nodes; when False, show only primary nodes.
+    expanded_programs: optional collection of programs enabling level of detail. When given and the graph has more
+                       than _LOD_NODE_MIN nodes, every multi-node program not in it is drawn as one clickable node
+                       (customdata CLUSTER_PREFIX + program) with its edges merged.
     """
     snapshot_folder = os.path.join("Snapshots", snapshot_folder_name)
 
@@ -26,47 +76,21 @@ def create_network_graph(snapshot_folder_name, include_classes=None, include_pro
         print(f"Error: Snapshot folder '{snapshot_folder}' does not exist")
         return None
 
-    json_files = [f for f in os.listdir(snapshot_folder) if f.endswith('.json')]
+    json_files = list_json_files(snapshot_folder)
 
     # Debug: Check if JSON files were found
     if not json_files:
         print(f"Error: No JSON files found in '{snapshot_folder}'")
         return None
 
-    nodes = find_nodes(json_files, snapshot_folder)
-    # Debug: Check if nodes were created
-    if not nodes:
-        print("Error: No nodes found")
+    layout = _get_layout(snapshot_folder_name, snapshot_folder, json_files, include_classes, include_programs,
+                         name_contains, include_secondary)
+    if layout is None:
         return None
-
-    print(f"Found {len(nodes)} initial nodes")
-
-    if include_secondary:
-        nodes = create_secondary_nodes(nodes)
-        print(f"Total nodes after secondary creation: {len(nodes)}")
-    else:
-        print("Skipping secondary node creation for this graph (primary-only)")
-
-    # Filter by include_classes if provided
-    if include_classes is not None:
-        class_set = set(include_classes)
-        nodes = [n for n in nodes if n.get('class') in class_set]
-        print(f"Nodes after class filter ({len(class_set)} selected): {len(nodes)}")
-
-    # Filter by include_programs if provided and not empty
-    if include_programs is not None and len(include_programs) > 0:
-        prog_set = set(include_programs)
-        nodes = [n for n in nodes if n.get('program') in prog_set]
-        print(f"Nodes after program filter ({len(prog_set)} selected): {len(nodes)}")
-
-    # Filter by name_contains if provided (case-insensitive substring on node 'name')
-    if name_contains:
-        term = name_contains.lower()
-        nodes = [n for n in nodes if isinstance(n.get('name'), str) and term in n.get('name').lower()]
-        print(f"Nodes after name filter ('{name_contains}') : {len(nodes)}")
+    G, pos, program_nodes, cluster_centers = layout
 
     # Early return with empty figure if no nodes to render
-    if not nodes:
+    if G.number_of_nodes() == 0:
         return go.Figure(data=[], layout=go.Layout(
             title=f'Configuration Network for {snapshot_folder_name} (No elements to display)',
             showlegend=False,
@@ -79,160 +103,88 @@ def create_network_graph(snapshot_folder_name, include_classes=None, include_pro
             height=800
         ))
 
-    # Compile regex patterns (case-insensitive); handle invalid patterns gracefully
-    def compile_pattern(pat):
-        if not pat:
-            return None
-        try:
-            return re.compile(pat, re.IGNORECASE)
-        except re.error as e:
-            print(f"Invalid regex pattern '{pat}': {e}")
-            return None
-
-    json_pat = compile_pattern(highlight_json_contains)
-    content_pat = compile_pattern(highlight_content_contains)
-
-    # Create a NetworkX graph
-    G = nx.DiGraph()
-
-    # Add nodes to the graph (include content/json for highlighting)
-    for node in nodes:
-        G.add_node(node['name'],
-                   display_name=node['display_name'],
-                   type=node['class'],
-                   query=node['query'],
-                   name=node['display_name'],
-                   program=node['program'],
-                   order=node.get('order', 'primary'),
-                   json_str=node.get('json'),
-                   content=node.get('content'))
-
-    # Add edges based on connections
-    for node in nodes:
-        source_node = node['name']
-        connections = node.get('connections', [])
-
-        for connection in connections:
-            if connection in G.nodes():
-                G.add_edge(source_node, connection,
-                           relation="references",
-                           edge_type="configuration_reference")
-
-    print(f"Created graph with {G.number_of_nodes()} nodes and {G.number_of_edges()} edges")
-
-    # Group nodes by program
-    program_nodes = {}
-    for node in G.nodes():
-        program = G.nodes[node]['program']
-        if program not in program_nodes:
-            program_nodes[program] = []
-        program_nodes[program].append(node)
-
-    # Create clustered positions
-    pos = {}
-    programs = list(program_nodes.keys())
-    num_programs = len(programs)
-
-    # Calculate cluster centers in a grid layout
-    grid_size = math.ceil(math.sqrt(num_programs)) if num_programs else 1
-    cluster_spacing = 8  # Distance between cluster centers
-
-    # Store cluster centers for labels
-    cluster_centers = {}
-
-    for i, program in enumerate(programs):
-        # Calculate cluster center position
-        row = i // grid_size
-        col = i % grid_size
-        center_x = col * cluster_spacing
-        center_y = row * cluster_spacing
-
-        # Store cluster center for label placement
-        cluster_centers[program] = (center_x, center_y)
-
-        # Get nodes for this program
-        program_node_list = program_nodes[program]
-
-        if len(program_node_list) == 1:
-            # Single node, place at center
-            pos[program_node_list[0]] = (center_x, center_y)
-        else:
-            # Multiple nodes, create subgraph and layout within cluster
-            program_subgraph = G.subgraph(program_node_list)
-
-            # Use spring layout for nodes within the cluster
-            cluster_pos = nx.spring_layout(program_subgraph, k=1, iterations=50, scale=2)
-
-            # Offset all positions to the cluster center
-            for node in program_node_list:
-                if node in cluster_pos:
-                    pos[node] = (cluster_pos[node][0] + center_x,
-                                 cluster_pos[node][1] + center_y)
-
-    # Define colors for different node types
-    class_colors = {
-        'MessageConfig': '#1f77b4',
-        'ClientTopic': '#ff7f0e',
-        'StandaloneFormula': '#2ca02c',
-        'ClientPageLayout': '#d62728',
-        'CustomFieldDef': '#bcbd22',
-        'ClientProgram': '#17becf',
-        'MessageCategory': '#9467bd',
-        'Incentive': '#8c564b',
-        'ClientRaffle': '#e377c2',
-        'ClientReward': '#7f7f7f',
-        'ClientTaskHandlerDefinition': '#ff9896',
-        'Rule': '#e377c2',
-        'RuleSet': '#7f7f7f',
-        'default': '#17becf'
-    }
-
-    # Prepare edge traces
-    edge_x = []
-    edge_y = []
-    for edge in G.edges():
-        if edge[0] in pos and edge[1] in pos:
-            x0, y0 = pos[edge[0]]
-            x1, y1 = pos[edge[1]]
-            edge_x.extend([x0, x1, None])
-            edge_y.extend([y0, y1, None])
-
-    edge_trace = go.Scatter(x=edge_x, y=edge_y,
-                            line=dict(width=0.5, color='#888'),
-                            hoverinfo='none',
-                            mode='lines')
-
-    # Create program label traces
-    label_traces = []
+    json_pat = _compile_highlight(highlight_json_contains)
+    content_pat = _compile_highlight(highlight_content_contains)
+
+
+    # Level of detail: node -> its collapsed program, for programs drawn as a single node
+    collapsed_of = {}
+    if expanded_programs is not None and G.number_of_nodes() > _LOD_NODE_MIN:
+        for program, program_node_list in program_nodes.items():
+            if len(program_node_list) > 1 and program not in expanded_programs:
+                for node in program_node_list:
+                    collapsed_of[node] = program
+
+    # Per-node arrays shared by the edge and node traces (row i describes node_list[i])
+    # node_infos[i] is node_list[i]'s attribute dict, fetched once and reused by every loop below
+    node_entries = [(node, node_info) for node, node_info in G.nodes(data=True)
+                    if node in pos and node not in collapsed_of]
+    node_list = [node for node, _ in node_entries]
+    node_infos = [node_info for _, node_info in node_entries]
+    node_index = {node: i for i, node in enumerate(node_list)}
+    node_xy = np.array([pos[node] for node in node_list], dtype=float).reshape(-1, 2)
+    connection_counts = np.fromiter((G.in_degree(node) + G.out_degree(node) for node in node_list),
+                                    dtype=int, count=len(node_list))
+    node_sizes = np.clip(10 + 2 * connection_counts, 8, 20)
+    node_colors = np.fromiter((_COLOR_INDEX.get(node_info['type'], _DEFAULT_COLOR_INDEX) for node_info in node_infos),
+                              dtype=np.uint8, count=len(node_infos))
+
+    # Prepare edge traces: one x/y array with a NaN gap after every segment
+    edge_idx = np.array([(node_index[u], node_index[v]) for u, v in G.edges()
+                         if u in node_index and v in node_index], dtype=np.intp).reshape(-1, 2)
+    edge_x = np.full(3 * len(edge_idx), np.nan)
+    edge_y = np.full(3 * len(edge_idx), np.nan)
+    edge_x[0::3], edge_x[1::3] = node_xy[edge_idx[:, 0], 0], node_xy[edge_idx[:, 1], 0]
+    edge_y[0::3], edge_y[1::3] = node_xy[edge_idx[:, 0], 1], node_xy[edge_idx[:, 1], 1]
+
+    cluster_traces = []
+    if collapsed_of:
+        cluster_traces.append(_cluster_trace(program_nodes, cluster_centers, collapsed_of))
+        cluster_x, cluster_y = _cluster_edges(G, pos, cluster_centers, collapsed_of)
+        edge_x = np.concatenate([edge_x, cluster_x])
+        edge_y = np.concatenate([edge_y, cluster_y])
+
+    # WebGL keeps thousands of edge segments responsive; program labels stay SVG for crisp text
+    edge_trace = go.Scattergl(x=edge_x, y=edge_y,
+                              line=dict(width=0.5, color='#888'),
+                              hoverinfo='none',
+                              mode='lines')
+    node_scatter = go.Scattergl if len(node_list) > _WEBGL_NODE_MIN else go.Scatter
+
+    # Create one text trace holding every program label
+    label_x = []
+    label_y = []
+    label_text = []
     even = True
     for program, (center_x, center_y) in cluster_centers.items():
         # Calculate actual cluster bounds for better label positioning
 
         if program in program_nodes:
-            program_x = [pos[node][0] for node in program_nodes[program] if node in pos]
             program_y = [pos[node][1] for node in program_nodes[program] if node in pos]
 
-            if program_x and program_y:
+            if program_y:
                 # Position label at top/bottom of cluster alternately
-                label_x = center_x
+                label_x.append(center_x)
                 if even:
-                    label_y = max(program_y) + 1  # Position above the cluster
+                    label_y.append(max(program_y) + 1)  # Position above the cluster
                     even = False
                 else:
-                    label_y = min(program_y) - 1 # Position below the cluster
+                    label_y.append(min(program_y) - 1)  # Position below the cluster
                     even = True
+                label_text.append(program.replace('ClientProgram:', ''))
 
-                label_trace = go.Scatter(
-                    x=[label_x],
-                    y=[label_y],
-                    mode='text',
-                    text=[program.replace('ClientProgram:', '')],
-                    textfont=dict(size=10, color='rgba(128, 128, 128, 0.8)'),
-                    textposition='middle center',
-                    showlegend=False,
-                    hoverinfo='none'
-                )
-                label_traces.append(label_trace)
+    label_traces = []
+    if label_text:
+        label_traces.append(go.Scatter(
+            x=label_x,
+            y=label_y,
+            mode='text',
+            text=label_text,
+            textfont=dict(size=10, color='rgba(128, 128, 128, 0.8)'),
+            textposition='middle center',
+            showlegend=False,
+            hoverinfo='none'
+        ))
 
     # Helper to stringify content for content regex
     def stringify_content(val):
@@ -260,55 +212,18 @@ def create_network_graph(snapshot_folder_name, include_classes=None, include_pro
     # When compare_mode, create fixed groups by override
     if compare_mode:
         compare_groups = {
-            'same': {'x': [], 'y': [], 'text': [], 'customdata': [], 'size': [], 'color': []},
-            'changed': {'x': [], 'y': [], 'text': [], 'customdata': [], 'size': [], 'color': []},
-            'distinct': {'x': [], 'y': [], 'text': [], 'customdata': [], 'size': [], 'color': []}
+            'same': {'index': [], 'text': [], 'customdata': []},
+            'changed': {'index': [], 'text': [], 'customdata': []},
+            'distinct': {'index': [], 'text': [], 'customdata': []}
         }
-        for node in G.nodes():
-            if node in pos:
-                x, y = pos[node]
-                node_info = G.nodes[node]
-
-                if node_info['order'] == "secondary":
-                    node_display = " **"
-                else:
-                    node_display = ""
-
-                context_hover_text = (f"<b>Name:</b> {node_info['display_name']}{node_display}<br>"
-                              f"<b>Type:</b> {node_info['type']}<br>"
-                              f"<b>Program:</b> {node_info['program']}<br>")
-
-                if node_info['order'] == "secondary":
-                    refers_to_hover_text = ""
-                else:
-                    refers_to_hover_text = f"<b>Refers To ({len(list(G.successors(node)))}):</b><br>"
-                    for successor in list(G.successors(node)):
-                        refers_to_hover_text += f"  {successor}<br>"
-                    if node_info['query'] == "True":
-                        refers_to_hover_text += "  <b>Query<br>"
-
-                referred_by_hover_text = f"<b>Referred By* ({len(list(G.predecessors(node)))}):</b><br>"
-                for predecessor in list(G.predecessors(node)):
-                    referred_by_hover_text += f"  {predecessor}<br>"
-                if node_info['order'] == "secondary":
-                    warning_hover_text = f"<b>Warning:</b> This is an implied element and could be missing context"
-                else:
-                    warning_hover_text = ""
-
-                hover_text = context_hover_text + refers_to_hover_text + referred_by_hover_text + warning_hover_text
+        for i, (node, node_info) in enumerate(node_entries):
+            hover_text = _hover_text(G, node, node_info)
 
-                base_color = class_colors.get(node_info['type'], class_colors['default'])
-                connection_count = len(list(G.successors(node))) + len(list(G.predecessors(node)))
-                size = max(8, min(20, 10 + connection_count * 2))
-
-                label = border_override.get(node, 'same')
-                bucket = compare_groups.get(label, compare_groups['same'])
-                bucket['x'].append(x)
-                bucket['y'].append(y)
-                bucket['text'].append(hover_text)
-                bucket['customdata'].append(node)
-                bucket['size'].append(size)
-                bucket['color'].append(base_color)
+            label = border_override.get(node, 'same')
+            bucket = compare_groups.get(label, compare_groups['same'])
+            bucket['index'].append(i)
+            bucket['text'].append(hover_text)
+            bucket['customdata'].append(node)
 
         # Build traces per compare bucket with distinct border colors
         node_traces = []
@@ -319,14 +234,15 @@ def create_network_graph(snapshot_folder_name, include_classes=None, include_pro
         }
         for key in ['same', 'changed', 'distinct']:
             grp = compare_groups[key]
-            if grp['x']:
-                node_traces.append(go.Scatter(
-                    x=grp['x'], y=grp['y'], mode='markers', hoverinfo='text', text=grp['text'],
+            if grp['index']:
+                idx = np.asarray(grp['index'], dtype=np.intp)
+                node_traces.append(node_scatter(
+                    x=node_xy[idx, 0], y=node_xy[idx, 1], mode='markers', hoverinfo='text', text=grp['text'],
                     customdata=grp['customdata'],
-                    marker=dict(size=grp['size'], color=grp['color'], line=dict(width=3, color=mapping[key]))
+                    marker=dict(size=node_sizes[idx], color=node_colors[idx], line=dict(width=3, color=mapping[key]), **_MARKER_COLORSCALE)
                 ))
 
-        all_traces = [edge_trace] + label_traces + node_traces
+        all_traces = [edge_trace] + label_traces + cluster_traces + node_traces
         fig = go.Figure(data=all_traces,
                         layout=go.Layout(
                             title=f'Configuration Network for {snapshot_folder_name} (Clustered by Program)',
@@ -340,143 +256,59 @@ def create_network_graph(snapshot_folder_name, include_classes=None, include_pro
                             height=800))
         return fig
 
-    # Buckets for nodes by border outcome (highlight mode)
-    groups = {
-        'matched': {'x': [], 'y': [], 'text': [], 'customdata': [], 'size': [], 'color': []},
-        'not_matched': {'x': [], 'y': [], 'text': [], 'customdata': [], 'size': [], 'color': []},
-        'na': {'x': [], 'y': [], 'text': [], 'customdata': [], 'size': [], 'color': []},
-        'default': {'x': [], 'y': [], 'text': [], 'customdata': [], 'size': [], 'color': []}
-    }
-
-    # Prepare node traces data
-    for node in G.nodes():
-        if node in pos:
-            x, y = pos[node]
-
-            # Create hover text
-            node_info = G.nodes[node]
-
-            if node_info['order'] == "secondary":
-                node_display = " **"
-            else:
-                node_display = ""
-
-            context_hover_text = (f"<b>Name:</b> {node_info['display_name']}{node_display}<br>"
-                          f"<b>Type:</b> {node_info['type']}<br>"
-                          f"<b>Program:</b> {node_info['program']}<br>")
-
-            if node_info['order'] == "secondary":
-                refers_to_hover_text = ""
-            else:
-                refers_to_hover_text = f"<b>Refers To ({len(list(G.successors(node)))}):</b><br>"
-                for successor in list(G.successors(node)):
-                    refers_to_hover_text += f"  {successor}<br>"
-                if node_info['query'] == "True":
-                    refers_to_hover_text += "  <b>Query<br>"
-
-            referred_by_hover_text = f"<b>Referred By* ({len(list(G.predecessors(node)))}):</b><br>"
-            for predecessor in list(G.predecessors(node)):
-                referred_by_hover_text += f"  {predecessor}<br>"
-            if node_info['order'] == "secondary":
-                warning_hover_text = f"<b>Warning:</b> This is an implied element and could be missing context"
-            else:
-                warning_hover_text = ""
-
-            hover_text = context_hover_text + refers_to_hover_text + referred_by_hover_text + warning_hover_text
-
-            # Set color based on type
-            base_color = class_colors.get(node_info['type'], class_colors['default'])
-
-            # Set size based on connections
-            connection_count = len(list(G.successors(node))) + len(list(G.predecessors(node)))
-            size = max(8, min(20, 10 + connection_count * 2))
-
-            # Determine highlight group
-            group_key = 'default'
-            if highlight_active:
-                json_available = node_info.get('json_str') is not None and str(node_info.get('json_str')).strip() != ""
-                content_str = stringify_content(node_info.get('content'))
-                content_available = content_str is not None
-
-                applicable_flags = []
-                match_flags = []
-
-                if json_pat is not None:
-                    applicable_flags.append(json_available)
-                    if json_available:
-                        try:
-                            match_flags.append(bool(json_pat.search(str(node_info.get('json_str')))))
-                        except Exception:
-                            match_flags.append(False)
-                    else:
-                        # not applicable
-                        pass
-
-                if content_pat is not None:
-                    applicable_flags.append(content_available)
-                    if content_available:
-                        try:
-                            match_flags.append(bool(content_pat.search(content_str)))
-                        except Exception:
-                            match_flags.append(False)
-                    else:
-                        pass
-
-                any_applicable = any(applicable_flags) if applicable_flags else False
-                if not any_applicable:
-                    group_key = 'na'
-                else:
-                    # If all applicable patterns matched -> matched
-                    if match_flags and all(match_flags):
-                        group_key = 'matched'
-                    else:
-                        group_key = 'not_matched'
-
-            # Append to the selected group
-            target = groups[group_key]
-            target['x'].append(x)
-            target['y'].append(y)
-            target['text'].append(hover_text)
-            target['customdata'].append(node)
-            target['size'].append(size)
-            target['color'].append(base_color)
-
-    # Build node traces
-    node_traces = []
-    if not highlight_active:
-        # Single default trace with white borders
-        node_traces.append(go.Scatter(
-            x=groups['default']['x'], y=groups['default']['y'],
-            mode='markers', hoverinfo='text', text=groups['default']['text'],
-            customdata=groups['default']['customdata'],
-            marker=dict(size=groups['default']['size'], color=groups['default']['color'], line=dict(width=2, color='white'))
-        ))
-    else:
-        # Matched (green), Not matched (red), Not applicable (black)
-        if groups['matched']['x']:
-            node_traces.append(go.Scatter(
-                x=groups['matched']['x'], y=groups['matched']['y'],
-                mode='markers', hoverinfo='text', text=groups['matched']['text'],
-                customdata=groups['matched']['customdata'],
-                marker=dict(size=groups['matched']['size'], color=groups['matched']['color'], line=dict(width=3, color='#2ecc71'))
-            ))
-        if groups['not_matched']['x']:
-            node_traces.append(go.Scatter(
-                x=groups['not_matched']['x'], y=groups['not_matched']['y'],
-                mode='markers', hoverinfo='text', text=groups['not_matched']['text'],
-                customdata=groups['not_matched']['customdata'],
-                marker=dict(size=groups['not_matched']['size'], color=groups['not_matched']['color'], line=dict(width=3, color='#e74c3c'))
-            ))
-        if groups['na']['x']:
-            node_traces.append(go.Scatter(
-                x=groups['na']['x'], y=groups['na']['y'],
-                mode='markers', hoverinfo='text', text=groups['na']['text'],
-                customdata=groups['na']['customdata'],
-                marker=dict(size=groups['na']['size'], color=groups['na']['color'], line=dict(width=3, color='#000000'))
-            ))
+    # Highlight mode keeps a single node trace and gives each node its own border colour, so a highlight
+    # change only alters marker.line and main.py can send it as a partial (Patch) update
+    node_text = []
+    border_colors = []
+    for node, node_info in node_entries:
+        # Create hover text
+        node_text.append(_hover_text(G, node, node_info))
+        if not highlight_active:
+            continue
+
+        # Determine highlight group
+        json_available = node_info.get('json_str') is not None and str(node_info.get('json_str')).strip() != ""
+        content_str = stringify_content(node_info.get('content'))
+        content_available = content_str is not None
+
+        applicable_flags = []
+        match_flags = []
+
+        if json_pat is not None:
+            applicable_flags.append(json_available)
+            if json_available:
+                try:
+                    match_flags.append(bool(json_pat.search(str(node_info.get('json_str')))))
+                except Exception:
+                    match_flags.append(False)
+
+        if content_pat is not None:
+            applicable_flags.append(content_available)
+            if content_available:
+                try:
+                    match_flags.append(bool(content_pat.search(content_str)))
+                except Exception:
+                    match_flags.append(False)
+
+        if not any(applicable_flags):
+            group_key = 'na'
+        elif match_flags and all(match_flags):
+            # All applicable patterns matched
+            group_key = 'matched'
+        else:
+            group_key = 'not_matched'
+        border_colors.append(_HIGHLIGHT_BORDERS[group_key])
+
+    # Matched (green), Not matched (red), Not applicable (black); white borders without a highlight
+    border = dict(width=3, color=border_colors) if highlight_active else dict(width=2, color='white')
+    node_traces = [node_scatter(
+        x=node_xy[:, 0], y=node_xy[:, 1], mode='markers', hoverinfo='text', text=node_text,
+        customdata=node_list,
+        marker=dict(size=node_sizes, color=node_colors, line=border, **_MARKER_COLORSCALE)
+    )]
 
     # Combine all traces
-    all_traces = [edge_trace] + label_traces + node_traces
+    all_traces = [edge_trace] + label_traces + cluster_traces + node_traces
 
     # Create the figure
     fig = go.Figure(data=all_traces,
@@ -494,7 +326,311 @@ def create_network_graph(snapshot_folder_name, include_classes=None, include_pro
     return fig
 
 
+class _LiteralPattern:
+    """Case-insensitive substring matcher with the search() interface of a compiled regex.
+    On ASCII text, lowercasing both sides matches exactly what re.IGNORECASE would; other text goes to the regex.
+    """
+
+    def __init__(self, pat):
+        self.needle = pat.lower()
+        self.regex = re.compile(re.escape(pat), re.IGNORECASE)
+
+    def search(self, text):
+        if text.isascii():
+            return self.needle in text.lower()
+        return self.regex.search(text) is not None
+
+
+def _compile_highlight(pat):
+    """Compile a highlight pattern once per figure (case-insensitive); None when empty or invalid.
+    Plain ASCII text skips the regex engine, which is several times slower on large raw JSON strings.
+    """
+    if not pat:
+        return None
+    if pat.isascii() and _REGEX_META.isdisjoint(pat):
+        return _LiteralPattern(pat)
+    try:
+        return re.compile(pat, re.IGNORECASE)
+    except re.error as e:
+        print(f"Invalid regex pattern '{pat}': {e}")
+        return None
+
+
+def _cluster_trace(program_nodes, cluster_centers, collapsed_of):
+    """One marker per collapsed program at its cluster centre, sized by how many nodes it stands for."""
+    programs = list(dict.fromkeys(collapsed_of.values()))
+    counts = np.array([len(program_nodes[program]) for program in programs])
+    return go.Scatter(
+        x=[cluster_centers[program][0] for program in programs],
+        y=[cluster_centers[program][1] for program in programs],
+        mode='markers', hoverinfo='text',
+        text=[f"Program: {program.replace('ClientProgram:', '')}<br>{count} elements (click to expand)"
+              for program, count in zip(programs, counts)],
+        customdata=[CLUSTER_PREFIX + program for program in programs],
+        marker=dict(size=np.clip(12 + 2 * np.sqrt(counts), 12, 40), color='#bbbbbb',
+                    line=dict(width=2, color='#555555'))
+    )
+
+
+def _cluster_edges(G, pos, cluster_centers, collapsed_of):
+    """Edge segments (x, y arrays with NaN gaps) for edges touching collapsed programs.
+    Each end is the node itself or its program's centre; duplicates and edges inside one program are dropped.
+    """
+    segments = set()
+    for u, v in G.edges():
+        program_u = collapsed_of.get(u)
+        program_v = collapsed_of.get(v)
+        if (program_u is None and program_v is None) or program_u == program_v:
+            continue
+        if u not in pos or v not in pos:
+            continue
+        start = cluster_centers[program_u] if program_u is not None else tuple(pos[u])
+        end = cluster_centers[program_v] if program_v is not None else tuple(pos[v])
+        segments.add((start, end))
+    x = np.full(3 * len(segments), np.nan)
+    y = np.full(3 * len(segments), np.nan)
+    for i, ((x0, y0), (x1, y1)) in enumerate(segments):
+        x[3 * i], x[3 * i + 1] = x0, x1
+        y[3 * i], y[3 * i + 1] = y0, y1
+    return x, y
+
+
+def _hover_text(G, node, node_info):
+    """Hover HTML for one node: name/type/program, what it refers to, and what refers to it."""
+    secondary = node_info['order'] == "secondary"
+    if secondary:
+        refers_to = ""
+    else:
+        successors = "".join(f"  {successor}<br>" for successor in G.successors(node))
+        query = "  <b>Query<br>" if node_info['query'] == "True" else ""
+        refers_to = f"<b>Refers To ({G.out_degree(node)}):</b><br>{successors}{query}"
+    referred_by = "".join(f"  {predecessor}<br>" for predecessor in G.predecessors(node))
+    warning = "<b>Warning:</b> This is an implied element and could be missing context" if secondary else ""
+    return (f"<b>Name:</b> {node_info['display_name']}{' **' if secondary else ''}<br>"
+            f"<b>Type:</b> {node_info['type']}<br>"
+            f"<b>Program:</b> {node_info['program']}<br>"
+            f"{refers_to}"
+            f"<b>Referred By* ({G.in_degree(node)}):</b><br>{referred_by}"
+            f"{warning}")
+
+
+# Bump when the layout algorithm changes so stale cached positions are not reused
+_LAYOUT_CACHE_VERSION = 5
+_LAYOUT_CACHE_DIR = ".cache"
+# Position files kept per snapshot (least recently used go first); every filter combination gets its own file
+_LAYOUT_CACHE_PER_SNAPSHOT = 8
+# Layouts recently used in this process, by cache path (least recent first). Highlight and expand changes
+# reuse the same layout, so they skip unpickling it again; the layouts are only read, never mutated.
+_LAYOUT_MEMO = OrderedDict()
+_LAYOUT_MEMO_SIZE = 4
+_LAYOUT_MEMO_LOCK = threading.Lock()
+
+
+def _get_layout(snapshot_name, snapshot_folder, json_files, include_classes, include_programs, name_contains,
+                include_secondary):
+    """Return (G, pos, program_nodes, cluster_centers) for a snapshot and filter state from memory, the
+    on-disk cache or a fresh build, in that order; None when the snapshot has no nodes.
+    """
+    cache_path = _layout_cache_path(snapshot_name, snapshot_folder, json_files,
+                                    (include_classes, include_programs, name_contains, include_secondary))
+    with _LAYOUT_MEMO_LOCK:
+        layout = _LAYOUT_MEMO.get(cache_path)
+        if layout is not None:
+            _LAYOUT_MEMO.move_to_end(cache_path)
+            return layout
+    graph = _build_graph(snapshot_name, snapshot_mtime(snapshot_folder, json_files), include_classes,
+                         include_programs, name_contains, include_secondary)
+    if graph is None:
+        return None
+    G, program_nodes = graph
+    positions = _load_layout_cache(cache_path)
+    if positions is None:
+        positions = _layout_positions(G, program_nodes)
+        _save_layout_cache(cache_path, positions)
+    layout = (G, positions[0], program_nodes, positions[1])
+    with _LAYOUT_MEMO_LOCK:
+        _LAYOUT_MEMO[cache_path] = layout
+        while len(_LAYOUT_MEMO) > _LAYOUT_MEMO_SIZE:
+            _LAYOUT_MEMO.popitem(last=False)
+    return layout
+
+
+def _layout_cache_path(snapshot_name, snapshot_folder, json_files, filters):
+    """Cache file for a snapshot's node positions: one digest over the JSON files' (name, mtime, size)
+    and one over the filters that change which nodes are laid out.
+    """
+    content = hashlib.blake2b(digest_size=16)
+    content.update(str(_LAYOUT_CACHE_VERSION).encode())
+    for json_file in sorted(json_files):
+        st = os.stat(os.path.join(snapshot_folder, json_file))
+        content.update(f"{json_file}\0{st.st_mtime_ns}\0{st.st_size}\n".encode())
+    include_classes, include_programs, name_contains, include_secondary = filters
+    filter_key = repr((sorted(include_classes) if include_classes is not None else None,
+                       sorted(include_programs) if include_programs else None,
+                       name_contains or None, bool(include_secondary)))
+    filter_digest = hashlib.blake2b(filter_key.encode(), digest_size=8).hexdigest()
+    return os.path.join(_LAYOUT_CACHE_DIR, f"{snapshot_name}_{content.hexdigest()}_{filter_digest}.pkl")
+
+
+def _load_layout_cache(cache_path):
+    try:
+        with open(cache_path, "rb") as f:
+            positions = pickle.load(f)
+        # Mark the file as recently used for _save_layout_cache's per-snapshot limit
+        os.utime(cache_path)
+        print(f"Loaded cached layout from {cache_path}")
+        return positions
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Ignoring unreadable layout cache {cache_path}: {e}")
+        return None
+
+
+def _save_layout_cache(cache_path, positions):
+    """Write (pos, cluster_centers) atomically. Drops files left over from older versions of the snapshot
+    and keeps at most _LAYOUT_CACHE_PER_SNAPSHOT files for it, removing the least recently used.
+    Only positions are stored; node attributes (and so config content) never leave Snapshots/.
+    """
+    try:
+        os.makedirs(_LAYOUT_CACHE_DIR, exist_ok=True)
+        snapshot_prefix, content_digest, _ = os.path.basename(cache_path).rsplit("_", 2)
+        current = []
+        # .cache also holds other caches' subdirectories; only layout files are candidates
+        with os.scandir(_LAYOUT_CACHE_DIR) as entries:
+            for entry in entries:
+                parts = entry.name.rsplit("_", 2)
+                if len(parts) != 3 or parts[0] != snapshot_prefix or not entry.name.endswith(".pkl") \
+                        or not entry.is_file():
+                    continue
+                if parts[1] != content_digest:
+                    os.remove(entry.path)
+                elif entry.path != cache_path:
+                    current.append((entry.stat().st_mtime_ns, entry.path))
+        for _mtime, path in sorted(current)[:max(0, len(current) - _LAYOUT_CACHE_PER_SNAPSHOT + 1)]:
+            os.remove(path)
+        # Unique per process and thread, since the warm-up thread and request threads may save the same layout
+        tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(positions, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except Exception as e:
+        print(f"Could not write layout cache {cache_path}: {e}")
+
+
+def _build_graph(snapshot_name, signature, include_classes, include_programs, name_contains, include_secondary):
+    """Filter a snapshot version's (shared, cached) nodes into its graph.
+    Returns (G, program_nodes), or None when the snapshot has no nodes at all.
+    """
+    nodes = load_snapshot_nodes(snapshot_name, signature)
+    # Debug: Check if nodes were created
+    if not nodes:
+        print("Error: No nodes found")
+        return None
+
+    print(f"Found {len(nodes)} initial nodes")
+
+    if include_secondary:
+        nodes = create_secondary_nodes(nodes)
+        print(f"Total nodes after secondary creation: {len(nodes)}")
+    else:
+        print("Skipping secondary node creation for this graph (primary-only)")
+
+    # Filter by include_classes if provided
+    if include_classes is not None:
+        class_set = set(include_classes)
+        nodes = [n for n in nodes if n.get('class') in class_set]
+        print(f"Nodes after class filter ({len(class_set)} selected): {len(nodes)}")
+
+    # Filter by include_programs if provided and not empty
+    if include_programs is not None and len(include_programs) > 0:
+        prog_set = set(include_programs)
+        nodes = [n for n in nodes if n.get('program') in prog_set]
+        print(f"Nodes after program filter ({len(prog_set)} selected): {len(nodes)}")
+
+    # Filter by name_contains if provided (case-insensitive substring on node 'name')
+    if name_contains:
+        term = name_contains.lower()
+        nodes = [n for n in nodes if isinstance(n.get('name'), str) and term in n.get('name').lower()]
+        print(f"Nodes after name filter ('{name_contains}') : {len(nodes)}")
+
+    # Create a NetworkX graph
+    G = nx.DiGraph()
+
+    # Add nodes to the graph (include content/json for highlighting), grouping them by program as we go
+    program_nodes = {}
+
+    def node_entries():
+        for node in nodes:
+            if node['name'] not in G:
+                program_nodes.setdefault(node['program'], []).append(node['name'])
+            yield node['name'], {
+                'display_name': node['display_name'],
+                'type': node['class'],
+                'query': node['query'],
+                'name': node['display_name'],
+                'program': node['program'],
+                'order': node.get('order', 'primary'),
+                'json_str': node.get('json'),
+                'content': node.get('content'),
+            }
+
+    G.add_nodes_from(node_entries())
+
+    # Add edges based on connections (only to nodes present in the graph)
+    G.add_edges_from(((node['name'], connection) for node in nodes for connection in node.get('connections', [])
+                      if connection in G),
+                     relation="references", edge_type="configuration_reference")
+
+    print(f"Created graph with {G.number_of_nodes()} nodes and {G.number_of_edges()} edges")
+    return G, program_nodes
+
+
+def _layout_positions(G, program_nodes):
+    """Lay out each program's nodes around its own center on a grid. Returns (pos, cluster_centers)."""
+    # Create clustered positions
+    pos = {}
+    programs = list(program_nodes.keys())
+    num_programs = len(programs)
+
+    # Calculate cluster centers in a grid layout
+    grid_size = math.ceil(math.sqrt(num_programs)) if num_programs else 1
+    cluster_spacing = 8  # Distance between cluster centers
+
+    # Store cluster centers for labels
+    cluster_centers = {}
+
+    # Energy-minimized spring layout for every multi-node cluster, computed in a few batched solves
+    cluster_pos = cluster_layouts(G, program_nodes, scale=2, iterations=25, k=1)
+
+    for i, program in enumerate(programs):
+        # Calculate cluster center position
+        row = i // grid_size
+        col = i % grid_size
+        center_x = col * cluster_spacing
+        center_y = row * cluster_spacing
+
+        # Store cluster center for label placement
+        cluster_centers[program] = (center_x, center_y)
+
+        # Get nodes for this program
+        program_node_list = program_nodes[program]
+
+        if len(program_node_list) == 1:
+            # Single node, place at center
+            pos[program_node_list[0]] = (center_x, center_y)
+        else:
+            # Offset all positions to the cluster center
+            for node in program_node_list:
+                if node in cluster_pos:
+                    pos[node] = (cluster_pos[node][0] + center_x,
+                                 cluster_pos[node][1] + center_y)
+
+    return pos, cluster_centers
+
+
 if __name__ == "__main__":
-    snapshot_name = "NDP2"  # Replace with your snapshot name
-    graph = create_network_graph(snapshot_name)
-    print(graph)  # This will print the graph object, you can visualize it using Plotly or NetworkX
+    # Snapshot names may be passed on the command line to pre-compute (and cache) their layouts
+    for snapshot_name in sys.argv[1:] or ["NDP2"]:  # Replace with your snapshot name
+        graph = create_network_graph(snapshot_name)
+        print(graph)  # This will print the graph object, you can visualize it using Plotly or NetworkX
@@ -0,0 +1,259 @@
+import math
+import os
+from concurrent.futures import CancelledError
+from concurrent.futures.process import BrokenProcessPool
+
+import networkx as nx
+import numpy as np
+import scipy as sp
+import scipy.spatial
+
+from Nodes import get_process_pool, reset_process_pool
+
+
+# Clusters at least this large are laid out alone with the Barnes-Hut-style solver below
+_LARGE_CLUSTER = 500
+# Repulsion grid for large clusters: at most this many cells per side
+_BH_GRID = 32
+# Rows of the (rows, cells, 2) far-field array evaluated at once
+_BH_CHUNK = 512
+# Clusters this small are simply placed on a circle; a solver buys nothing at 2-6 nodes
+_CIRCLE_MAX = 6
+# Clusters at least this large start from their spectral embedding instead of a circle
+_SPECTRAL_MIN = 10
+# Fixed seed so the same cluster always gets the same layout (and cached layouts stay valid)
+_SEED = 0x5EED
+# Max padded cells (clusters x size x size) per batched solve; bounds the (C, m, m, 2) delta array to ~32 MB
+_BATCH_CELLS = 2_000_000
+# Solver work is spread over the shared worker pool only when clusters hold at least this many nodes in total
+_PARALLEL_MIN_NODES = 2000
+
+
+def cluster_layouts(G, program_nodes, scale=2, iterations=25, k=1.0, large_iterations=50):
+    """Lay out each multi-node program cluster.
+    Returns {node: (x, y)} with every cluster centred on the origin and rescaled to [-scale, scale].
+    Small clusters minimize the Fruchterman-Reingold energy with L-BFGS, matching
+    nx.spring_layout(G.subgraph(cluster), k=k, iterations=iterations, scale=scale, method="energy"),
+    and are solved together in a few padded numpy batches instead of one call per cluster.
+    Large clusters run large_iterations Fruchterman-Reingold steps with grid-approximated repulsion.
+    Clusters of up to _CIRCLE_MAX nodes skip the solvers and sit evenly on a circle of radius scale.
+    Layouts are deterministic: see _initial_positions.
+    """
+    pos = {}
+    clusters = []
+    for node_list in program_nodes.values():
+        if len(node_list) > _CIRCLE_MAX:
+            clusters.append(node_list)
+        elif len(node_list) >= 2:
+            step = 2 * math.pi / len(node_list)
+            for i, node in enumerate(node_list):
+                pos[node] = (scale * math.cos(i * step), scale * math.sin(i * step))
+    if not clusters:
+        return pos
+
+    # One adjacency matrix for every clustered node; each cluster's block is sliced out of it,
+    # so no per-cluster subgraph view or conversion is needed
+    nodelist = [node for node_list in clusters for node in node_list]
+    adjacency = nx.to_scipy_sparse_array(G, nodelist=nodelist, weight=None, format="csr")
+    cluster_adj = []
+    offset = 0
+    for node_list in clusters:
+        idx = np.arange(offset, offset + len(node_list))
+        cluster_adj.append(adjacency[idx][:, idx])
+        offset += len(node_list)
+
+    # Each large cluster and each batch of small ones is an independent solve
+    jobs = []
+    small = []
+    for node_list, adj in zip(clusters, cluster_adj):
+        if len(node_list) >= _LARGE_CLUSTER:
+            jobs.append((_bh_fruchterman_reingold, (node_list, adj, scale, large_iterations, k)))
+        else:
+            small.append((node_list, adj))
+
+    # Similar sizes share a batch so little of each padded block is wasted
+    small.sort(key=lambda cluster: len(cluster[0]))
+    batch = []
+    for node_list, adj in small:
+        if batch and (len(batch) + 1) * len(node_list) ** 2 > _BATCH_CELLS:
+            jobs.append((_batched_energy_layout, (batch, scale, iterations, k)))
+            batch = []
+        batch.append((node_list, adj))
+    if batch:
+        jobs.append((_batched_energy_layout, (batch, scale, iterations, k)))
+
+    for job_pos in _run_jobs(jobs, len(nodelist)):
+        pos.update(job_pos)
+    return pos
+
+
+def _run_jobs(jobs, num_nodes):
+    """Run (function, args) layout jobs, on the shared worker pool when there is enough work for it.
+    Only node lists and sparse adjacency blocks are pickled, never the graph. Results keep job order.
+    """
+    if len(jobs) >= 2 and num_nodes >= _PARALLEL_MIN_NODES and (os.cpu_count() or 1) > 1:
+        pool = get_process_pool()
+        try:
+            return [future.result() for future in [pool.submit(fn, *args) for fn, args in jobs]]
+        except (BrokenProcessPool, OSError) as e:
+            print(f"Parallel layout unavailable, laying out serially: {e}")
+            reset_process_pool(pool)
+        except (CancelledError, RuntimeError) as e:
+            # Another thread discarded the pool while these jobs were using it
+            print(f"Parallel layout interrupted, laying out serially: {e!r}")
+    return [fn(*args) for fn, args in jobs]
+
+
+def _batched_energy_layout(clusters, scale, iterations, k, gravity=1.0, threshold=1e-4):
+    """Minimize networkx's Fruchterman-Reingold energy for several clusters in one L-BFGS run.
+    clusters is a list of (node_list, sparse adjacency) pairs.
+    The energy is a sum of independent per-cluster terms, so solving them jointly gives each cluster
+    its own layout. Clusters are padded to the largest size in the batch; padded slots are inert.
+    """
+    num = len(clusters)
+    size = max(len(node_list) for node_list, _ in clusters)
+    adj = np.zeros((num, size, size))
+    real = np.zeros((num, size), dtype=bool)
+    for ci, (node_list, cluster_adj) in enumerate(clusters):
+        n = len(node_list)
+        real[ci, :n] = True
+        adj[ci, :n, :n] = cluster_adj.toarray()
+    # Attraction is symmetric in the energy formulation
+    adj = (adj + adj.transpose(0, 2, 1)) / 2
+    pair = real[:, :, None] & real[:, None, :]
+
+    # Gravity pulls each connected component of each cluster towards (0.5, 0.5) so parts don't drift apart
+    flat = sp.sparse.block_diag([sp.sparse.csr_array(a) for a in adj], format="csr")
+    _, labels = sp.sparse.csgraph.connected_components(flat, directed=False)
+    _, labels = np.unique(labels.reshape(num, size)[real], return_inverse=True)
+    counts = np.bincount(labels)
+
+    def cost(x):
+        pos = x.reshape((num, size, 2))
+        delta = pos[:, :, None, :] - pos[:, None, :, :]
+        distance2 = np.maximum(np.sum(delta * delta, axis=-1), 1e-10)
+        distance = np.sqrt(distance2)
+        ad = adj * distance
+        coef = np.where(pair, ad / k - k ** 2 / distance2, 0.0)
+        grad = 2 * np.einsum("cij,cijk->cik", coef, delta)
+        total = np.sum(ad * distance2) / (3 * k) - k ** 2 * np.sum(np.log(distance[pair]))
+
+        centers = np.zeros((len(counts), 2))
+        np.add.at(centers, labels, pos[real])
+        delta0 = centers / counts[:, None] - 0.5
+        grad[real] += gravity * delta0[labels]
+        total += gravity * 0.5 * np.sum(counts * np.linalg.norm(delta0, axis=1) ** 2)
+        grad[~real] = 0.0
+        return total, grad.ravel()
+
+    start = np.zeros((num, size, 2))
+    for ci, (node_list, cluster_adj) in enumerate(clusters):
+        start[ci, :len(node_list)] = _initial_positions(cluster_adj)
+    result = sp.optimize.minimize(cost, start.ravel(), method="L-BFGS-B", jac=True,
+                                  options={"maxiter": iterations, "gtol": threshold})
+    pos = result.x.reshape((num, size, 2))
+
+    out = {}
+    for ci, (node_list, _) in enumerate(clusters):
+        cluster_pos = nx.rescale_layout(pos[ci, :len(node_list)].copy(), scale=scale)
+        for node, (x, y) in zip(node_list, cluster_pos):
+            out[node] = (x, y)
+    return out
+
+
+def _bh_fruchterman_reingold(node_list, adj, scale, iterations, k):
+    """Fruchterman-Reingold steps (as in networkx) with Barnes-Hut-style approximate repulsion.
+    Nodes are binned into a grid each step. Pairs in the same or adjacent cells repel exactly;
+    every other cell acts as one body at its centre of mass. Attraction uses only the edges,
+    so a step costs O(N * cells + near pairs + E) instead of O(N^2).
+    """
+    n = len(node_list)
+    src, dst = adj.nonzero()
+
+    grid = max(2, min(_BH_GRID, int(np.sqrt(n / 2))))
+    neighbours = np.array([(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)])
+
+    pos = _initial_positions(adj)
+    t = (pos.max(axis=0) - pos.min(axis=0)).max() * 0.1
+    dt = t / (iterations + 1)
+
+    for _ in range(iterations):
+        displacement = np.zeros((n, 2))
+
+        # Attraction along edges (force on the source only, like the dense networkx version)
+        if len(src):
+            delta = pos[src] - pos[dst]
+            distance = np.clip(np.linalg.norm(delta, axis=1), 0.01, None)
+            np.add.at(displacement, src, -delta * (distance / k)[:, None])
+
+        # Bin nodes and summarize each cell by its mass and centre of mass
+        lo = pos.min(axis=0)
+        width = max((pos.max(axis=0) - lo).max(), 1e-9) / grid
+        cell_xy = np.minimum(((pos - lo) / width).astype(np.intp), grid - 1)
+        cell = cell_xy[:, 0] * grid + cell_xy[:, 1]
+        mass = np.bincount(cell, minlength=grid * grid).astype(float)
+        occupied = mass > 0
+        com = np.zeros((grid * grid, 2))
+        com[:, 0] = np.bincount(cell, weights=pos[:, 0], minlength=grid * grid)
+        com[:, 1] = np.bincount(cell, weights=pos[:, 1], minlength=grid * grid)
+        com[occupied] /= mass[occupied, None]
+        com_occ, mass_occ = com[occupied], mass[occupied]
+
+        # Far field: every occupied cell as a single body...
+        for start in range(0, n, _BH_CHUNK):
+            stop = min(start + _BH_CHUNK, n)
+            delta = pos[start:stop, None, :] - com_occ[None, :, :]
+            distance2 = np.clip(np.sum(delta * delta, axis=-1), 1e-4, None)
+            displacement[start:stop] += k * k * np.einsum("ijk,ij->ik", delta, mass_occ / distance2)
+        # ...minus the cells next to each node, which are handled exactly below
+        near_xy = cell_xy[:, None, :] + neighbours[None, :, :]
+        inside = np.all((near_xy >= 0) & (near_xy < grid), axis=-1)
+        near_cell = np.where(inside, near_xy[..., 0] * grid + near_xy[..., 1], 0)
+        delta = pos[:, None, :] - com[near_cell]
+        distance2 = np.clip(np.sum(delta * delta, axis=-1), 1e-4, None)
+        weight = np.where(inside, mass[near_cell], 0.0) / distance2
+        displacement -= k * k * np.einsum("ijk,ij->ik", delta, weight)
+
+        # Near field: exact repulsion between nodes whose cells touch (including each node with itself,
+        # which cancels the node's own share of the centre-of-mass term removed above)
+        pairs = sp.spatial.cKDTree(cell_xy).query_pairs(1, p=np.inf, output_type="ndarray")
+        if len(pairs):
+            i, j = pairs[:, 0], pairs[:, 1]
+            delta = pos[i] - pos[j]
+            distance2 = np.clip(np.sum(delta * delta, axis=-1), 1e-4, None)
+            force = k * k * delta / distance2[:, None]
+            np.add.at(displacement, i, force)
+            np.add.at(displacement, j, -force)
+
+        length = np.clip(np.linalg.norm(displacement, axis=1), 0.01, None)
+        pos += displacement * (t / length)[:, None]
+        t -= dt
+
+    pos = nx.rescale_layout(pos, scale=scale)
+    return {node: (x, y) for node, (x, y) in zip(node_list, pos)}
+
+
+def _initial_positions(adj):
+    """Deterministic starting positions in the unit square for one cluster, given its adjacency.
+    Mid-sized clusters start from their spectral embedding, tiny ones from a circle, and large ones
+    from a seeded random square (a sparse eigen-solve there can cost more than the layout itself).
+    A small seeded jitter separates coincident points, which would otherwise never push apart.
+    """
+    rng = np.random.default_rng(_SEED)
+    n = adj.shape[0]
+    if n >= _LARGE_CLUSTER:
+        return rng.random((n, 2))
+    if n >= _SPECTRAL_MIN:
+        # Two smallest non-trivial eigenvectors of the undirected graph Laplacian (as nx.spectral_layout)
+        sym = ((adj + adj.T).toarray() > 0).astype(float)
+        laplacian = np.diag(sym.sum(axis=1)) - sym
+        _, vectors = np.linalg.eigh(laplacian)
+        pos = vectors[:, 1:3].copy()
+    else:
+        theta = np.arange(n) * (2 * np.pi / n)
+        pos = np.column_stack([np.cos(theta), np.sin(theta)])
+    pos -= pos.min(axis=0)
+    extent = pos.max()
+    if extent > 0:
+        pos /= extent
+    return pos + rng.random((n, 2)) * 1e-3
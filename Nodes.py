@@ -1,65 +1,220 @@
-import json
+import multiprocessing
 import os
 import re
+import threading
+from functools import lru_cache
+from concurrent.futures import CancelledError, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from FastJson import dumps_pretty, loads as json_loads
+
+
+# Only large snapshots on machines with cores to spare are parsed across worker processes. Each spawned worker
+# re-imports the entry module (about 1.4 s when that is main.py with Dash) and the parent still unpickles every
+# node, which costs roughly half of a serial parse, so anything smaller parses faster in this process.
+_PARALLEL_MIN_BYTES = 64 << 20
+_PARALLEL_MIN_CPUS = 4
+_PROCESS_POOL = None
+# Request threads and the warm-up thread may start or discard the pool at the same time
+_PROCESS_POOL_LOCK = threading.Lock()
+
+
+# Every node comes from an item carrying this key; files whose bytes lack it are skipped without parsing
+_NODE_KEY = b'"__reference_comparison_key"'
+
+
+# Any <<...>> token in an item's keys or string values is a candidate reference
+# (NUL is excluded because scan_item joins the strings with it)
+_REF_RE = re.compile(r'<<[^>\0]+>>')
+
+
+# "<<Type:" prefix of a node name -> item type; ClientProgram names need no colon
+_CLASS_RE = re.compile(r'<<(?:(MessageConfig|ClientTopic|StandaloneFormula|ClientPageLayout|MessageCategory'
+                       r'|CustomFieldDef|Incentive|Rule|ClientRaffle|ClientReward|ClientTaskHandlerDefinition'
+                       r'|RuleSet):|(ClientProgram))')
+
+
+# folder -> (folder mtime in ns, JSON file names); adding/removing/renaming a file bumps the folder mtime
+_JSON_LISTING_CACHE = {}
+# root -> (root mtime in ns, snapshot folder names); same invalidation rule
+_SNAPSHOT_LISTING_CACHE = {}
+
+
+def list_json_files(folder):
+    """Return the .json file names in a snapshot folder, re-scanning only when the folder changes."""
+    mtime = os.stat(folder).st_mtime_ns
+    cached = _JSON_LISTING_CACHE.get(folder)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with os.scandir(folder) as entries:
+        # d_type from the directory read answers is_file() without a stat, so folders named *.json are skipped for free
+        files = [entry.name for entry in entries if entry.name.endswith('.json') and entry.is_file()]
+    _JSON_LISTING_CACHE[folder] = (mtime, files)
+    return files
+
+
+def list_snapshots(root="Snapshots"):
+    """Return the snapshot folder names under root, re-scanning only when root changes."""
+    mtime = os.stat(root).st_mtime_ns
+    cached = _SNAPSHOT_LISTING_CACHE.get(root)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with os.scandir(root) as entries:
+        snapshots = [entry.name for entry in entries if entry.is_dir()]
+    _SNAPSHOT_LISTING_CACHE[root] = (mtime, snapshots)
+    return snapshots
+
+
+def get_process_pool():
+    """Return the shared worker pool (snapshot parsing, cluster layouts), starting it on first use ("spawn" is safe inside the threaded server)."""
+    global _PROCESS_POOL
+    with _PROCESS_POOL_LOCK:
+        if _PROCESS_POOL is None:
+            _PROCESS_POOL = ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn"))
+        return _PROCESS_POOL
+
+
+def reset_process_pool(pool):
+    """Discard pool, the shared worker pool that just failed (e.g. a worker died); the next use starts a fresh one.
+    A pool another thread has already replaced is left alone.
+    """
+    global _PROCESS_POOL
+    with _PROCESS_POOL_LOCK:
+        if _PROCESS_POOL is not pool:
+            return
+        _PROCESS_POOL = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
 
 def find_nodes(files, folder):
+    paths = [os.path.join(folder, json_file) for json_file in files]
+    per_file = None
+    if (os.cpu_count() or 1) >= _PARALLEL_MIN_CPUS and len(paths) > 1 \
+            and sum(os.path.getsize(path) for path in paths) >= _PARALLEL_MIN_BYTES:
+        # Parsing is CPU-bound pure Python, so spread large snapshots over worker processes
+        pool = get_process_pool()
+        try:
+            chunksize = max(1, len(paths) // (4 * (os.cpu_count() or 1)))
+            per_file = list(pool.map(_nodes_from_file, paths, chunksize=chunksize))
+            # Workers leave out the pretty JSON, which would triple the pickled payload; orjson rebuilds it quickly
+            for file_nodes in per_file:
+                for node in file_nodes:
+                    _set_json(node)
+        except (BrokenProcessPool, OSError) as e:
+            print(f"Parallel parse unavailable, parsing serially: {e}")
+            reset_process_pool(pool)
+        except (CancelledError, RuntimeError) as e:
+            # Another thread discarded the pool while this parse was using it
+            print(f"Parallel parse interrupted, parsing serially: {e!r}")
+    if per_file is None:
+        # Overlap the file reads on a thread pool; parsing and node building stay in this thread
+        with ThreadPoolExecutor(max_workers=min(32, len(paths) or 1)) as executor:
+            blobs = list(executor.map(_read_file, paths))
+        per_file = [_nodes_from_blob(blob) for blob in blobs]
+
     nodes = []
-    for json_file in files:
-        json_code = json.load(open(os.path.join(folder, json_file), 'r'))
-
-        if not isinstance(json_code, list):
-            new_json_code = []
-            for json_category in json_code['_children'].keys():
-                json_items = json_code['_children'][json_category]
-                if isinstance(json_items, list):
-                    for json_item in json_items:
-                        if isinstance(json_item, dict) and '__reference_comparison_key' in json_item:
-                            new_json_code.append(json_item)
-            json_code = new_json_code
-
-
-        for item in json_code:
-            node = {}
-            if not isinstance(item, dict):
-                continue
+    for file_nodes in per_file:
+        nodes.extend(file_nodes)
+    return nodes
+
+
+def _read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _nodes_from_file(path):
+    """Parse one snapshot JSON file into its primary nodes, without their 'json' (runs in worker processes)."""
+    return _nodes_from_blob(_read_file(path), with_json=False)
 
-            node_name = item.get("__reference_comparison_key")
-            if node_name:
-                node['name'] = node_name
-                node['display_name'] = node_name[2:].split("[")[0].strip().split(":")[1].strip()
-                node_type = classify_item_type(node_name)
-                node['class'] = node_type
-                node['program'] = node_name.split("[")[1].strip()[:-3].replace("ClientProgram:", "")
-
-                item_string = str(item)
-                node['content'] = get_content(item, node_type, item_string)
-                # Build connections and filter out self-references
-                refs = get_references(item_string)
-                node['connections'] = [r for r in refs if r != node_name]
-                node['order'] = "primary"
-                node['query'] = "False"
-
-                # Store raw and prettified JSON for consistent display/search
-                node['raw'] = item
-                try:
-                    node_pretty = json.dumps(item, indent=2, sort_keys=True, default=str)
-                except Exception:
-                    node_pretty = item_string
-                node['json_pretty'] = node_pretty
-                node['json'] = node_pretty  # use prettified JSON as the stored JSON string
-
-                if "qry" in item_string:
-                    node['query'] = "True"
-
-                my_array = []
-
-                if node_type is not None:
-                    nodes.append(node)
+
+def _nodes_from_blob(blob, with_json=True):
+    if _NODE_KEY not in blob:
+        return []
+    return _nodes_from_json(json_loads(blob), with_json)
+
+
+def _set_json(node):
+    """Store the item's sorted, indented JSON text as node['json'] (shown, searched and compared)."""
+    try:
+        node['json'] = dumps_pretty(node['raw'], sort_keys=True)
+    except Exception:
+        node['json'] = str(node['raw'])
+
+
+def _nodes_from_json(json_code, with_json=True):
+    """Build the primary nodes of one parsed snapshot file; with_json=False leaves 'json' to _set_json."""
+    nodes = []
+    if not isinstance(json_code, list):
+        new_json_code = []
+        for json_category in json_code['_children'].keys():
+            json_items = json_code['_children'][json_category]
+            if isinstance(json_items, list):
+                for json_item in json_items:
+                    if isinstance(json_item, dict) and '__reference_comparison_key' in json_item:
+                        new_json_code.append(json_item)
+        json_code = new_json_code
+
+    for item in json_code:
+        node = {}
+        if not isinstance(item, dict):
+            continue
+
+        node_name = item.get("__reference_comparison_key")
+        if node_name:
+            node['name'] = node_name
+            node['display_name'] = node_name[2:].split("[")[0].strip().split(":")[1].strip()
+            node_type = classify_item_type(node_name)
+            node['class'] = node_type
+            node['program'] = node_name.split("[")[1].strip()[:-3].replace("ClientProgram:", "")
+
+            # One structural pass over the item's keys and strings instead of scanning a serialized copy
+            refs, has_query, has_formula = scan_item(item)
+            node['content'] = get_content(item, node_type, has_formula)
+            # Build connections and filter out self-references
+            node['connections'] = [r for r in refs if r != node_name]
+            node['order'] = "primary"
+            node['query'] = "False"
+
+            # Store raw and prettified JSON for consistent display/search
+            node['raw'] = item
+            if with_json:
+                _set_json(node)
+
+            if has_query:
+                node['query'] = "True"
+
+            if node_type is not None:
+                nodes.append(node)
 
     return nodes
 
 
-def get_content(json_obj, node_type, string):
+def snapshot_mtime(folder, files):
+    """Return the newest modification time (ns) across a snapshot folder and its JSON files."""
+    latest = os.stat(folder).st_mtime_ns
+    for json_file in files:
+        latest = max(latest, os.stat(os.path.join(folder, json_file)).st_mtime_ns)
+    return latest
+
+
+def snapshot_signature(snapshot):
+    """Newest mtime (ns) of a snapshot folder and its JSON files; changes whenever the snapshot does."""
+    folder = os.path.join("Snapshots", snapshot)
+    return snapshot_mtime(folder, list_json_files(folder))
+
+
+@lru_cache(maxsize=8)
+def load_snapshot_nodes(snapshot, signature):
+    """Return the primary nodes of a snapshot as a tuple, parsed once per snapshot version and shared by the
+    graph, node panel, compare and export code, which must not modify them.
+    signature (see snapshot_signature) is only part of the cache key, so an edited snapshot is parsed again.
+    """
+    folder = os.path.join("Snapshots", snapshot)
+    return tuple(find_nodes(list_json_files(folder), folder))
+
+
+def get_content(json_obj, node_type, has_formula=False):
     """Extract the content from the item name."""
     if node_type == "MessageConfig":
         return json_obj['message']['body'], json_obj['message']['subject'], json_obj['message']['notificationText']
@@ -67,7 +222,7 @@ def get_content(json_obj, node_type, string):
         return json_obj['name'], json_obj['info']
     if node_type == "CustomFieldDef":
         default_value = json_obj['defaultValue']
-        if "_dummy__formula" in string and default_value is None:
+        if has_formula and default_value is None:
             default_value = "Calculated Using Formula"
         return json_obj['fieldType'], json_obj['fieldDataType'], default_value
     if node_type == "ClientPageLayout":
@@ -84,99 +239,95 @@ def get_content(json_obj, node_type, string):
     return None
 
 
+@lru_cache(maxsize=65536)
 def classify_item_type(name):
     """Classify the item type based on its name."""
-    if "<<MessageConfig:" in name:
-        return "MessageConfig"
-    elif "<<ClientTopic:" in name:
-        return "ClientTopic"
-    elif "<<StandaloneFormula:" in name:
-        return "StandaloneFormula"
-    elif "<<ClientPageLayout:" in name:
-        return "ClientPageLayout"
-    elif "<<MessageCategory:" in name:
-        return "MessageCategory"
-    elif "<<CustomFieldDef:" in name:
-        return "CustomFieldDef"
-    elif "<<Incentive:" in name:
-        return "Incentive"
-    elif "<<Rule:" in name:
-        return "Rule"
-    elif "<<ClientRaffle:" in name:
-        return "ClientRaffle"
-    elif "<<ClientReward:" in name:
-        return "ClientReward"
-    elif "<<ClientProgram" in name:
-        return "ClientProgram"
-    elif "<<ClientTaskHandlerDefinition:" in name:
-        return "ClientTaskHandlerDefinition"
-    elif "<<RuleSet:" in name:
-        if "None" not in name:
-            return "RuleSet"
-        else:
-            return None
-    else:
+    match = _CLASS_RE.search(name)
+    if match is None:
+        return None
+    item_type = match.group(1) or match.group(2)
+    if item_type == "RuleSet" and "None" in name:
         return None
+    return item_type
 
 
+def _item_strings(item):
+    """Return every dict key and string value in a parsed JSON value, in document order."""
+    strings = []
+    stack = [item]
+    while stack:
+        obj = stack.pop()
+        if isinstance(obj, str):
+            strings.append(obj)
+        elif isinstance(obj, dict):
+            # Reversed so keys and values pop off the stack in document order
+            for key, value in reversed(obj.items()):
+                stack.append(value)
+                stack.append(key)
+        elif isinstance(obj, list):
+            stack.extend(reversed(obj))
+    return strings
 
-def get_references(string):
-    """Extract references from the item string."""
-    references = []
 
-    for match in re.finditer(r'<<[^>]+>>', string):
-        reference = match.group(0).strip()
-        if reference and str(reference) not in references:
-            if classify_item_type(str(reference)) is not None:
-                references.append(str(reference))
-    return references
+def scan_item(item):
+    """Scan an item's keys and string values once.
+    Returns (node references in first-seen order, whether "qry" appears, whether "_dummy__formula" appears).
+    """
+    # NUL never occurs inside a reference, so joining on it keeps tokens from spanning two strings
+    text = "\0".join(_item_strings(item))
+    # Ordered dict: token -> whether it classifies as a node; each distinct token is classified once
+    references = {}
+    for match in _REF_RE.finditer(text):
+        reference = match.group(0)
+        if reference not in references:
+            references[reference] = classify_item_type(reference) is not None
+    nodes = [reference for reference, is_node in references.items() if is_node]
+    return nodes, "qry" in text, "_dummy__formula" in text
 
 
 def create_secondary_nodes(nodes):
-    all_nodes = []
-    all_nodes_names = set()
+    all_nodes = list(nodes)
+    all_nodes_names = {node['name'] for node in nodes}
 
+    # Each referenced-but-missing name is classified and parsed once, on first sight
     for node in nodes:
-        all_nodes_names.add(node['name'])
-        all_nodes.append(node)
-
-    for node in all_nodes:
         for connection in node['connections']:
             connection = str(connection).strip()
-            if connection not in all_nodes_names:
-
-                all_nodes_names.add(connection)
-                if connection.startswith("<<") and connection.endswith(">>") and ":" in connection:
-                    pass
-                else:
-                    continue
-
-                if classify_item_type(connection) == "ClientProgram":
-                    new_node = {
-                        'name': connection,
-                        'display_name': connection.split(":")[1].strip()[:-2],
-                        'class': classify_item_type(connection),
-                        'program': connection.split(":")[1].strip()[:-2],
-                        'content': None,
-                        'connections': [],
-                        'order': "secondary",
-                        'query': "False",
-                        'json': None
-                    }
-                else:
-                    new_node = {
-                        'name': connection,
-                        'display_name': connection[2:].split("[")[0].strip().split(":")[1].strip(),
-                        'class': classify_item_type(connection),
-                        'program': connection.split("[")[1].strip()[:-3].replace("ClientProgram:", ""),
-                        'content': None,
-                        'connections': [],
-                        'order': "secondary",
-                        'query': "False",
-                        'json': None
-                    }
-
-                if new_node['class'] is not None:
-                    all_nodes.append(new_node)
+            if connection in all_nodes_names:
+                continue
+            all_nodes_names.add(connection)
+            if not (connection.startswith("<<") and connection.endswith(">>") and ":" in connection):
+                continue
+
+            node_class = classify_item_type(connection)
+            if node_class is None:
+                continue
+            if node_class == "ClientProgram":
+                display_name = program = connection.split(":")[1].strip()[:-2]
+            else:
+                display_name = connection[2:].split("[")[0].strip().split(":")[1].strip()
+                program = connection.split("[")[1].strip()[:-3].replace("ClientProgram:", "")
+            all_nodes.append({
+                'name': connection,
+                'display_name': display_name,
+                'class': node_class,
+                'program': program,
+                'content': None,
+                'connections': [],
+                'order': "secondary",
+                'query': "False",
+                'json': None
+            })
 
     return all_nodes
+
+
+def build_reverse_index(nodes):
+    """Map each node name to the names of the nodes whose connections reference it.
+    Sources are listed once each, in the order the nodes appear.
+    """
+    reverse = {}
+    for node in nodes:
+        for ref in (node.get('connections', []) or []):
+            reverse.setdefault(ref, {})[node['name']] = None
+    return {name: list(sources) for name, sources in reverse.items()}
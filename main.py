@@ -4,298 +4,449 @@
 # 3.) Create a network graph using plotly
 # 4.) Display the network graph with DASH
 
+import logging
 import os
+import threading
+from functools import lru_cache
 import dash
-from dash import dcc, html
-from dash.dependencies import Input, Output, ALL, State
+from dash import dcc, html, Patch
+from dash.dependencies import Input, Output, ALL, MATCH, State
+from dash.exceptions import PreventUpdate
 from flask import Flask
+import plotly.io as pio
+
+# Flask-Caching is optional; with it, serialized figures are shared across WSGI worker processes
+try:
+    from flask_caching import Cache
+except ImportError:
+    Cache = None
+
+# Flask-Compress is optional; with it, large figure responses go out br/gzip-compressed
+try:
+    from flask_compress import Compress
+except ImportError:
+    Compress = None
+
+# diskcache is optional; with dash[diskcache] installed, CSV exports run as background callbacks
+try:
+    import diskcache
+except ImportError:
+    diskcache = None
+
 import Graph
 from Click import node_clicked
 from Content import download_message_content_as_csv, download_incentive_content_as_csv, \
-    download_client_custom_fields_content_as_csv, download_client_page_layout_content_as_csv
-from Nodes import find_nodes, create_secondary_nodes
-import json
-
-
-def main():
-    # Check if Snapshots directory exists, create if not
-    if not os.path.exists("Snapshots"):
-        os.makedirs("Snapshots")
-
-    if not os.path.exists("Content"):
-        os.makedirs("Content")
-
-    # Print absolute locations to help users place files
+    download_client_custom_fields_content_as_csv, download_client_page_layout_content_as_csv, \
+    download_all_content_as_csv
+from FastJson import loads as json_loads
+from Nodes import create_secondary_nodes, build_reverse_index, list_snapshots, load_snapshot_nodes, \
+    snapshot_signature
+
+# Callback failures go through logging so the traceback is kept alongside the message
+log = logging.getLogger("mhc")
+
+
+CLASS_NAMES = [
+    "MessageConfig","ClientTopic","StandaloneFormula","ClientPageLayout",
+    "CustomFieldDef","ClientProgram","MessageCategory","Incentive","Rule","RuleSet", "ClientRaffle",
+    "ClientReward","ClientTaskHandlerDefinition"
+]
+
+# Static checklist options for the class filter, built once at import
+CLASS_OPTIONS = [
+    {"label": html.Span(name, className=f"label-{name}"), "value": name}
+    for name in CLASS_NAMES
+]
+
+
+def _legend_items(entries):
+    """Swatch + label spans for (swatch modifier class, label) pairs; the looks live in styles.css."""
+    items = []
+    for swatch_class, label in entries:
+        items.append(html.Span(" ", className=f"legend-dot {swatch_class}"))
+        items.append(html.Span(label, className="helper-note"))
+    return items
+
+
+# Static legends, built once and shared by every page build
+HIGHLIGHT_LEGEND = [
+    html.P("Outline Legend:", className="legend-title"),
+    html.P(_legend_items([("legend-dot-match", "Match"), ("legend-dot-no-match", "No match"),
+                          ("legend-dot-na", "N/A"), ("legend-dot-default", "Default")]), className="legend-row")
+]
+COMPARE_LEGEND = html.Div(
+    [html.Span("Outline Legend:", className="legend-title")]
+    + _legend_items([("legend-dot-same", "Same"), ("legend-dot-changed", "Changed"), ("legend-dot-distinct", "Distinct")]),
+    className="legend-row compare-legend"
+)
+
+# Render WebGL traces (edges, large node sets) at 2x so they stay as sharp as the SVG ones on HiDPI screens
+GRAPH_CONFIG = {"plotGlPixelRatio": 2}
+
+# Download button kind -> export function returning (status message, dcc.Download data or None)
+DOWNLOAD_KINDS = {
+    "incentive": download_incentive_content_as_csv,
+    "message": download_message_content_as_csv,
+    "custom-fields": download_client_custom_fields_content_as_csv,
+    "page-layout": download_client_page_layout_content_as_csv,
+    "all": download_all_content_as_csv,
+}
+
+
+@lru_cache(maxsize=8)
+def _load_nodes_cached(snapshot, mtime_sig):
+    """Return (nodes including secondary ones, {name: first node with that name}, reverse index,
+    sorted program names) for a snapshot.
+    mtime_sig is only part of the cache key, so an edited snapshot is parsed again.
+    """
+    nodes = create_secondary_nodes(load_snapshot_nodes(snapshot, mtime_sig))
+    nodes_by_name = {}
+    for node in nodes:
+        nodes_by_name.setdefault(node['name'], node)
+    programs = sorted({node['program'] for node in nodes if node.get('program')})
+    return nodes, nodes_by_name, build_reverse_index(nodes), programs
+
+
+def _load_nodes(snapshot):
+    """Return the cached _load_nodes_cached tuple for a snapshot, reparsing only after its files change."""
+    return _load_nodes_cached(snapshot, snapshot_signature(snapshot))
+
+
+@lru_cache(maxsize=256)
+def _node_panel(snapshot, mtime_sig, node_name):
+    """Return the details panel for a node of a snapshot version, or None if there is no such node.
+    Revisiting a node (double clicks, following links back and forth) reuses the built component tree.
+    """
+    _nodes, nodes_by_name, reverse_adj, _programs = _load_nodes_cached(snapshot, mtime_sig)
+    node_details = nodes_by_name.get(node_name)
+    if not node_details:
+        return None
+    return node_clicked(node_details, reverse_adj)
+
+
+@lru_cache(maxsize=64)
+def _cached_graph(snapshot, mtime_sig, classes_key, programs_key, search_text, json_highlight, content_highlight,
+                  expanded_key):
+    """Build the main graph figure once per snapshot version and filter state.
+    classes_key/programs_key/expanded_key are sorted tuples (or None) so re-toggling a checkbox hits the cache.
+    The figure is cached pre-serialized (as plain JSON types), so cache hits skip Plotly's figure walk.
+    """
+    fig = Graph.create_network_graph(
+        snapshot,
+        include_classes=classes_key,
+        include_programs=programs_key,
+        name_contains=search_text,
+        highlight_json_contains=json_highlight,
+        highlight_content_contains=content_highlight,
+        expanded_programs=expanded_key
+    )
+    # A missing or empty snapshot has no figure; cache the empty one instead of failing on every update
+    if fig is None:
+        return {}
+    return json_loads(pio.to_json(fig, validate=False))
+
+
+def _warm_graph_cache(graph_figure, snapshots):
+    """Build each snapshot's default view (all classes and programs, no search or highlight) ahead of the
+    first request, with the same cache keys update_graph uses.
+    """
+    classes_key = tuple(sorted(CLASS_NAMES))
+    for snapshot in snapshots:
+        try:
+            programs_key = tuple(_load_nodes(snapshot)[3])
+            graph_figure(snapshot, snapshot_signature(snapshot), classes_key, programs_key, None, None, None, ())
+        except Exception:
+            log.exception("Could not prebuild graph for %s", snapshot)
+    print("Graph cache warm-up finished")
+
+
+# --- Page Layouts ---
+# The page trees are static (snapshot lists and defaults arrive through callbacks), so each is built once
+# per process, on the first visit to its route, and the same component tree is served from then on.
+@lru_cache(maxsize=None)
+def _home_layout():
     snapshots_abs = os.path.abspath("Snapshots")
     content_abs = os.path.abspath("Content")
-    print(f"Snapshots folder: {snapshots_abs}")
-    print(f"Content folder:   {content_abs}")
-    print("To add a new snapshot, create a subfolder under the Snapshots folder and put your .json files inside it.")
-
-    # Get list of existing snapshots
-    snapshots = [d for d in os.listdir("Snapshots") if os.path.isdir(os.path.join("Snapshots", d))]
-
-    # Create the Dash application
-    server = Flask(__name__)
-    app = dash.Dash(
-        __name__,
-        server=server,
-        assets_folder=os.path.join(os.path.dirname(__file__), 'Styling', 'CSS'),
-        suppress_callback_exceptions=True
-    )
+    return html.Div([
+        html.Div([
+            html.H1("MHC Configuration Visualization Tool"),
+            html.P("By Alex Habegger - GitHub: @ahabegger")
+        ], className="header-card"),
+
+        html.Details([
+            html.Summary("How to Add Snapshots", className="filter-summary"),
+            html.Div([
+                html.P("Where to add new snapshots:", className="helper-text"),
+                html.P("Place JSON files under this folder (one subfolder per snapshot):"),
+                html.P(["Snapshots folder: ", html.Code(snapshots_abs)]),
+                html.P("After adding a folder, click 'Refresh Snapshot List' to see it in the dropdown."),
+                html.P(["Content folder (CSV exports): ", html.Code(content_abs)])
+            ], className="status-box")
+        ], open=False, className="filter-section"),
+
+        html.Div([
+            html.Div([
+                dcc.Dropdown(
+                    id="snapshot-dropdown",
+                    options=[],  # filled by refresh_snapshots when the page mounts
+                    placeholder="Select a snapshot to view",
+                    value=None,  # picked in the browser after first paint, see select_first_snapshot
+                    className="snapshot-dropdown"
+                ),
+                html.Button("Refresh Snapshot List", id="refresh-button", className="btn btn-secondary"),
+                html.Button("Refresh Graph", id="refresh-graph-button", className="btn btn-message"),
+                dcc.Link("Compare Snapshots →", href="/compare", className="btn btn-secondary", id="go-compare-link")
+            ], className="controls-row"),
 
-    class_names = [
-        "MessageConfig","ClientTopic","StandaloneFormula","ClientPageLayout",
-        "CustomFieldDef","ClientProgram","MessageCategory","Incentive","Rule","RuleSet", "ClientRaffle",
-        "ClientReward","ClientTaskHandlerDefinition"
-    ]
+            # Collapsible filter section - classes
+            html.Details([
+                html.Summary("Filter By Element", className="filter-summary"),
+                dcc.Checklist(
+                    id="class-filter",
+                    options=CLASS_OPTIONS,
+                    value=CLASS_NAMES,
+                    className="checklist"
+                )
+            ], open=False, className="filter-section"),
 
-    class_options = [
-        {"label": html.Span(name, className=f"label-{name}"), "value": name}
-        for name in class_names
-    ]
+            # Collapsible filter section - programs
+            html.Details([
+                html.Summary("Filter By Program", className="filter-summary"),
+                dcc.Checklist(
+                    id="program-filter",
+                    options=[],  # populated dynamically based on selected snapshot
+                    value=[],    # default to all programs in snapshot via callback
+                    className="checklist"
+                ),
+                dcc.Store(id="programs-store", data={})
+            ], open=False, className="filter-section"),
 
-    # --- Page Layouts ---
-    def home_layout():
-        return html.Div([
-            html.Div([
-                html.H1("MHC Configuration Visualization Tool"),
-                html.P("By Alex Habegger - GitHub: @ahabegger")
-            ], className="header-card"),
+            # Collapsible filter section - search by node name
+            html.Details([
+                html.Summary("Filter By Search", className="filter-summary"),
+                html.Div([
+                    html.Span("🔎", className="search-icon"),
+                    dcc.Input(
+                        id="search-filter",
+                        type="text",
+                        placeholder="Type to include nodes whose name contains...",
+                        value="",
+                        debounce=True,
+                        className="search-input"
+                    ),
+                    html.Button("Reset", id="reset-search-button", title="Clear search", className="search-reset-btn")
+                ], className="search-input-wrapper")
+            ], open=False, className="filter-section"),
 
+            # New: Highlight section - search within raw JSON
             html.Details([
-                html.Summary("How to Add Snapshots", className="filter-summary"),
+                html.Summary("Highlight By Search In JSON", className="filter-summary"),
+                html.Div([
+                    html.Span("🧩", className="search-icon"),
+                    dcc.Input(
+                        id="json-highlight",
+                        type="text",
+                        placeholder="Highlight nodes whose raw JSON contains...",
+                        value="",
+                        debounce=True,
+                        className="search-input"
+                    ),
+                    html.Button("Reset", id="reset-json-highlight", title="Clear JSON highlight", className="search-reset-btn")
+                ], className="search-input-wrapper"),
                 html.Div([
-                    html.P("Where to add new snapshots:", className="helper-text"),
-                    html.P("Place JSON files under this folder (one subfolder per snapshot):"),
-                    html.P(["Snapshots folder: ", html.Code(snapshots_abs)]),
-                    html.P("After adding a folder, click 'Refresh Snapshot List' to see it in the dropdown."),
-                    html.P(["Content folder (CSV exports): ", html.Code(content_abs)])
-                ], className="status-box")
+                    html.P("Enter a Regular Expression (case-insensitive) to test against each node's raw JSON.", className="helper-text"),
+                    html.P("For help with Regular Expressions, see https://regex101.com/ or https://regexr.com/ of use ChatGPT to generate patterns.", className="helper-text"),
+                    html.P("Border colors: Green = matches, Red = does not match, Black = not applicable (no JSON).", className="helper-note"),
+                    html.P("If both highlight fields are used, a node must match all provided patterns to be green.", className="helper-note"),
+                    html.P(" ", className="helper-note"),  # Extra space
+                    *HIGHLIGHT_LEGEND
+                ])
             ], open=False, className="filter-section"),
 
-            html.Div([
+            # New: Highlight section - search within extracted content
+            html.Details([
+                html.Summary("Highlight By Search in Content", className="filter-summary"),
                 html.Div([
-                    dcc.Dropdown(
-                        id="snapshot-dropdown",
-                        options=[{"label": s, "value": s} for s in snapshots],
-                        placeholder="Select a snapshot to view",
-                        value=snapshots[0] if snapshots else None,
-                        className="snapshot-dropdown"
+                    html.Span("✨", className="search-icon"),
+                    dcc.Input(
+                        id="content-highlight",
+                        type="text",
+                        placeholder="Highlight nodes whose extracted content contains...",
+                        value="",
+                        debounce=True,
+                        className="search-input"
                     ),
-                    html.Button("Refresh Snapshot List", id="refresh-button", className="btn btn-secondary"),
-                    html.Button("Refresh Graph", id="refresh-graph-button", className="btn btn-message"),
-                    dcc.Link("Compare Snapshots →", href="/compare", className="btn btn-secondary", id="go-compare-link")
-                ], className="controls-row"),
-
-                # Collapsible filter section - classes
-                html.Details([
-                    html.Summary("Filter By Element", className="filter-summary"),
-                    dcc.Checklist(
-                        id="class-filter",
-                        options=class_options,
-                        value=class_names,
-                        className="checklist"
-                    )
-                ], open=False, className="filter-section"),
-
-                # Collapsible filter section - programs
-                html.Details([
-                    html.Summary("Filter By Program", className="filter-summary"),
-                    dcc.Checklist(
-                        id="program-filter",
-                        options=[],  # populated dynamically based on selected snapshot
-                        value=[],    # default to all programs in snapshot via callback
-                        className="checklist"
-                    )
-                ], open=False, className="filter-section"),
-
-                # Collapsible filter section - search by node name
-                html.Details([
-                    html.Summary("Filter By Search", className="filter-summary"),
-                    html.Div([
-                        html.Span("🔎", className="search-icon"),
-                        dcc.Input(
-                            id="search-filter",
-                            type="text",
-                            placeholder="Type to include nodes whose name contains...",
-                            value="",
-                            debounce=True,
-                            className="search-input"
-                        ),
-                        html.Button("Reset", id="reset-search-button", title="Clear search", className="search-reset-btn")
-                    ], className="search-input-wrapper")
-                ], open=False, className="filter-section"),
-
-                # New: Highlight section - search within raw JSON
-                html.Details([
-                    html.Summary("Highlight By Search In JSON", className="filter-summary"),
-                    html.Div([
-                        html.Span("🧩", className="search-icon"),
-                        dcc.Input(
-                            id="json-highlight",
-                            type="text",
-                            placeholder="Highlight nodes whose raw JSON contains...",
-                            value="",
-                            debounce=True,
-                            className="search-input"
-                        ),
-                        html.Button("Reset", id="reset-json-highlight", title="Clear JSON highlight", className="search-reset-btn")
-                    ], className="search-input-wrapper"),
-                    html.Div([
-                        html.P("Enter a Regular Expression (case-insensitive) to test against each node's raw JSON.", className="helper-text"),
-                        html.P("For help with Regular Expressions, see https://regex101.com/ or https://regexr.com/ of use ChatGPT to generate patterns.", className="helper-text"),
-                        html.P("Border colors: Green = matches, Red = does not match, Black = not applicable (no JSON).", className="helper-note"),
-                        html.P("If both highlight fields are used, a node must match all provided patterns to be green.", className="helper-note"),
-                        html.P(" ", className="helper-note"),  # Extra space
-                        html.P("Outline Legend:", style={'fontWeight': '600', 'marginRight': '8px'}),
-                        html.P([
-                            html.Span(" ", style={'display': 'inline-block', 'width': '12px', 'height': '12px', 'borderRadius': '50%', 'backgroundColor': '#ddd', 'border': '3px solid #2ecc71', 'marginRight': '6px'}),
-                            html.Span("Match", className="helper-note", style={'marginRight': '12px'}),
-                            html.Span(" ", style={'display': 'inline-block', 'width': '12px', 'height': '12px', 'borderRadius': '50%', 'backgroundColor': '#ddd', 'border': '3px solid #e74c3c', 'marginRight': '6px'}),
-                            html.Span("No match", className="helper-note", style={'marginRight': '12px'}),
-                            html.Span(" ", style={'display': 'inline-block', 'width': '12px', 'height': '12px', 'borderRadius': '50%', 'backgroundColor': '#ddd', 'border': '3px solid #000000', 'marginRight': '6px'}),
-                            html.Span("N/A", className="helper-note", style={'marginRight': '12px'}),
-                            html.Span(" ", style={'display': 'inline-block', 'width': '12px', 'height': '12px', 'borderRadius': '50%', 'backgroundColor': '#ddd', 'border': '2px solid #ffffff', 'boxShadow': '0 0 0 1px #ccc inset', 'marginRight': '6px'}),
-                            html.Span("Default", className="helper-note"),
-                        ], className="legend-row", style={'display': 'flex', 'alignItems': 'center', 'gap': '2px', 'margin': '6px 0 10px'})
-                    ])
-                ], open=False, className="filter-section"),
-
-                # New: Highlight section - search within extracted content
-                html.Details([
-                    html.Summary("Highlight By Search in Content", className="filter-summary"),
-                    html.Div([
-                        html.Span("✨", className="search-icon"),
-                        dcc.Input(
-                            id="content-highlight",
-                            type="text",
-                            placeholder="Highlight nodes whose extracted content contains...",
-                            value="",
-                            debounce=True,
-                            className="search-input"
-                        ),
-                        html.Button("Reset", id="reset-content-highlight", title="Clear Content highlight", className="search-reset-btn")
-                    ], className="search-input-wrapper"),
-                    html.Div([
-                        html.P("Enter a Regular Expression (case-insensitive) to test against extracted node content (e.g., message bodies, field defaults, HTML blocks).", className="helper-text"),
-                        html.P("For help with Regular Expressions, see https://regex101.com/ or https://regexr.com/ of use ChatGPT to generate patterns.", className="helper-text"),
-                        html.P("Border colors: Green = matches, Red = does not match, Black = not applicable (no or empty content).", className="helper-note"),
-                        html.P("If both highlight fields are used, a node must match all provided patterns to be green.", className="helper-note"),
-                        html.P(" ", className="helper-note"),  # Extra space
-                        html.P("Outline Legend:", style={'fontWeight': '600', 'marginRight': '8px'}),
-                        html.P([
-                            html.Span(" ", style={'display': 'inline-block', 'width': '12px', 'height': '12px', 'borderRadius': '50%', 'backgroundColor': '#ddd', 'border': '3px solid #2ecc71', 'marginRight': '6px'}),
-                            html.Span("Match", className="helper-note", style={'marginRight': '12px'}),
-                            html.Span(" ", style={'display': 'inline-block', 'width': '12px', 'height': '12px', 'borderRadius': '50%', 'backgroundColor': '#ddd', 'border': '3px solid #e74c3c', 'marginRight': '6px'}),
-                            html.Span("No match", className="helper-note", style={'marginRight': '12px'}),
-                            html.Span(" ", style={'display': 'inline-block', 'width': '12px', 'height': '12px', 'borderRadius': '50%', 'backgroundColor': '#ddd', 'border': '3px solid #000000', 'marginRight': '6px'}),
-                            html.Span("N/A", className="helper-note", style={'marginRight': '12px'}),
-                            html.Span(" ", style={'display': 'inline-block', 'width': '12px', 'height': '12px', 'borderRadius': '50%', 'backgroundColor': '#ddd', 'border': '2px solid #ffffff', 'boxShadow': '0 0 0 1px #ccc inset', 'marginRight': '6px'}),
-                            html.Span("Default", className="helper-note"),
-                        ], className="legend-row", style={'display': 'flex', 'alignItems': 'center', 'gap': '2px', 'margin': '6px 0 10px'})
-                    ])
-                ], open=False, className="filter-section"),
-
-
-                dcc.Graph(id="network-graph", className="network-graph"),
-                # Add this div to display clicked node information
-                html.Div(id="node-info", className="node-info-box")
-            ], className="panel-box"),
+                    html.Button("Reset", id="reset-content-highlight", title="Clear Content highlight", className="search-reset-btn")
+                ], className="search-input-wrapper"),
+                html.Div([
+                    html.P("Enter a Regular Expression (case-insensitive) to test against extracted node content (e.g., message bodies, field defaults, HTML blocks).", className="helper-text"),
+                    html.P("For help with Regular Expressions, see https://regex101.com/ or https://regexr.com/ of use ChatGPT to generate patterns.", className="helper-text"),
+                    html.P("Border colors: Green = matches, Red = does not match, Black = not applicable (no or empty content).", className="helper-note"),
+                    html.P("If both highlight fields are used, a node must match all provided patterns to be green.", className="helper-note"),
+                    html.P(" ", className="helper-note"),  # Extra space
+                    *HIGHLIGHT_LEGEND
+                ])
+            ], open=False, className="filter-section"),
 
-            html.H3("* = Elements could be referrenced by non-uploaded elements or by queries"),
-            html.H3("** = Implied elements created to represent references to non-uploaded elements (missing context)"),
-            html.Div([
-                html.Button("Download Incentive Content", id="download-incentive-button",
-                            title="Export Incentive content to CSV", className="btn btn-incentive"),
-                html.Button("Download Message Content", id="download-message-button",
-                            title="Export Message content to CSV", className="btn btn-message"),
-                html.Button("Download Custom Fields Content", id="download-custom-fields-button",
-                            title="Export Custom Field definitions to CSV", className="btn btn-custom"),
-                html.Button("Download Page Layout Content***", id="download-page-layout-button",
-                            title="Export Page Layout HTML content to CSV", className="btn btn-layout")
-            ], className="buttons-row"),
-
-            # Download status box (below the buttons)
+
+            dcc.Store(id="expanded-programs", data=[]),
+            # Everything but the highlights that the figure on screen was built from (see update_graph)
+            dcc.Store(id="graph-state"),
             dcc.Loading(
-                id="download-loading",
+                id="graph-loading",
                 type="default",
                 color="#999",
-                children=html.Div(id="download-status", className="status-box")
+                children=dcc.Graph(id="network-graph", className="network-graph", config=GRAPH_CONFIG)
             ),
-
-            html.Div("*** = Only downloads HTML Elements from page layouts", className="footnote")
-        ], className="app-container")
-
-    def compare_layout():
-        # Rebuild snapshots list to reflect latest
-        current_snapshots = [d for d in os.listdir("Snapshots") if os.path.isdir(os.path.join("Snapshots", d))]
-        return html.Div([
+            # Add this div to display clicked node information
+            html.Div(id="node-info", className="node-info-box"),
+            # Name of the last clicked connection link, written in the browser
+            dcc.Store(id="clicked-node-store")
+        ], className="panel-box"),
+
+        html.H3("* = Elements could be referrenced by non-uploaded elements or by queries"),
+        html.H3("** = Implied elements created to represent references to non-uploaded elements (missing context)"),
+        html.Div([
+            html.Button("Download Incentive Content", id={"type": "download-button", "kind": "incentive"},
+                        title="Export Incentive content to CSV", className="btn btn-incentive"),
+            html.Button("Download Message Content", id={"type": "download-button", "kind": "message"},
+                        title="Export Message content to CSV", className="btn btn-message"),
+            html.Button("Download Custom Fields Content", id={"type": "download-button", "kind": "custom-fields"},
+                        title="Export Custom Field definitions to CSV", className="btn btn-custom"),
+            html.Button("Download Page Layout Content***", id={"type": "download-button", "kind": "page-layout"},
+                        title="Export Page Layout HTML content to gzip-compressed CSV", className="btn btn-layout"),
+            html.Button("Download All Content***", id={"type": "download-button", "kind": "all"},
+                        title="Export all four content CSVs in one pass", className="btn btn-secondary")
+        ], className="buttons-row"),
+
+        # Download status box (below the buttons)
+        dcc.Loading(
+            id="download-loading",
+            type="default",
+            color="#999",
+            children=html.Div(id="download-status", className="status-box")
+        ),
+        *[dcc.Download(id={"type": "download-file", "kind": kind}) for kind in DOWNLOAD_KINDS],
+
+        html.Div("*** = Only downloads HTML Elements from page layouts", className="footnote")
+    ], className="app-container")
+
+@lru_cache(maxsize=None)
+def _compare_layout():
+    return html.Div([
+        html.Div([
+            html.H1("Compare Snapshots"),
+            html.P("Select two snapshots to compare their configuration graphs side-by-side."),
+            dcc.Link("← Back to Graph", href="/", className="btn btn-secondary")
+        ], className="header-card"),
+
+        # Compare legend
+        COMPARE_LEGEND,
+
+        # Controls row with snapshot selectors
+        html.Div([
             html.Div([
-                html.H1("Compare Snapshots"),
-                html.P("Select two snapshots to compare their configuration graphs side-by-side."),
-                dcc.Link("← Back to Graph", href="/", className="btn btn-secondary")
-            ], className="header-card"),
-
-            # Compare legend
+                html.Label("Snapshot A"),
+                dcc.Dropdown(
+                    id="compare-snapshot-a",
+                    options=[],  # options and defaults are filled in when the page mounts
+                    value=None,
+                    placeholder="Select Snapshot A",
+                    className="snapshot-dropdown"
+                )
+            ], className="compare-picker"),
             html.Div([
-                html.Span("Outline Legend:", style={'fontWeight': '600', 'marginRight': '8px'}),
-                html.Span(" ", style={'display': 'inline-block', 'width': '12px', 'height': '12px', 'borderRadius': '50%', 'backgroundColor': '#ddd', 'border': '3px solid #000000', 'marginRight': '6px'}),
-                html.Span("Same", className="helper-note", style={'marginRight': '12px'}),
-                html.Span(" ", style={'display': 'inline-block', 'width': '12px', 'height': '12px', 'borderRadius': '50%', 'backgroundColor': '#ddd', 'border': '3px solid #f39c12', 'marginRight': '6px'}),
-                html.Span("Changed", className="helper-note", style={'marginRight': '12px'}),
-                html.Span(" ", style={'display': 'inline-block', 'width': '12px', 'height': '12px', 'borderRadius': '50%', 'backgroundColor': '#ddd', 'border': '3px solid #e74c3c', 'marginRight': '6px'}),
-                html.Span("Distinct", className="helper-note"),
-            ], className="legend-row", style={'display': 'flex', 'alignItems': 'center', 'gap': '2px', 'margin': '0 0 10px'}),
-
-            # Controls row with snapshot selectors
+                html.Label("Snapshot B"),
+                dcc.Dropdown(
+                    id="compare-snapshot-b",
+                    options=[],
+                    value=None,
+                    placeholder="Select Snapshot B",
+                    className="snapshot-dropdown"
+                )
+            ], className="compare-picker"),
+            html.Button("Refresh Snapshot List", id="compare-refresh-button", className="btn btn-secondary"),
+            html.Button("Compare", id="compare-run-button", className="btn btn-message")
+        ], className="controls-row"),
+
+        html.Div([
             html.Div([
-                html.Div([
-                    html.Label("Snapshot A"),
-                    dcc.Dropdown(
-                        id="compare-snapshot-a",
-                        options=[{"label": s, "value": s} for s in current_snapshots],
-                        value=(current_snapshots[0] if current_snapshots else None),
-                        placeholder="Select Snapshot A",
-                        className="snapshot-dropdown"
-                    )
-                ], className="compare-picker"),
-                html.Div([
-                    html.Label("Snapshot B"),
-                    dcc.Dropdown(
-                        id="compare-snapshot-b",
-                        options=[{"label": s, "value": s} for s in current_snapshots],
-                        value=(current_snapshots[1] if current_snapshots and len(current_snapshots) > 1 else (current_snapshots[0] if current_snapshots else None)),
-                        placeholder="Select Snapshot B",
-                        className="snapshot-dropdown"
-                    )
-                ], className="compare-picker"),
-                html.Button("Refresh Snapshot List", id="compare-refresh-button", className="btn btn-secondary"),
-                html.Button("Compare", id="compare-run-button", className="btn btn-message")
-            ], className="controls-row"),
-
+                html.H2("Snapshot A"),
+                dcc.Loading(
+                    type="default",
+                    color="#999",
+                    children=dcc.Graph(id="compare-graph-a", className="network-graph", config=GRAPH_CONFIG)
+                )
+            ], className="panel-box"),
             html.Div([
-                html.Div([
-                    html.H2("Snapshot A"),
-                    dcc.Graph(id="compare-graph-a", className="network-graph")
-                ], className="panel-box"),
-                html.Div([
-                    html.H2("Snapshot B"),
-                    dcc.Graph(id="compare-graph-b", className="network-graph")
-                ], className="panel-box")
-            ], className="two-col"),
+                html.H2("Snapshot B"),
+                dcc.Loading(
+                    type="default",
+                    color="#999",
+                    children=dcc.Graph(id="compare-graph-b", className="network-graph", config=GRAPH_CONFIG)
+                )
+            ], className="panel-box")
+        ], className="two-col"),
+
+        html.H1("Differences"),
+        dcc.Loading(
+            type="default",
+            color="#999",
+            children=html.Div(id="compare-diff")
+        )
+    ], className="app-container")
 
-            html.H1("Differences"),
-            html.Div(id="compare-diff")
-        ], className="app-container")
 
-    # Provide a validation layout that includes all components from all pages
-    app.validation_layout = html.Div([
-        dcc.Location(id='url'),
-        home_layout(),
-        compare_layout()
-    ])
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    # Create the Snapshots and Content directories if missing (safe when several workers start at once)
+    os.makedirs("Snapshots", exist_ok=True)
+    os.makedirs("Content", exist_ok=True)
 
+    # Print absolute locations to help users place files
+    snapshots_abs = os.path.abspath("Snapshots")
+    content_abs = os.path.abspath("Content")
+    print(f"Snapshots folder: {snapshots_abs}")
+    print(f"Content folder:   {content_abs}")
+    print("To add a new snapshot, create a subfolder under the Snapshots folder and put your .json files inside it.")
+
+    # Get list of existing snapshots
+    snapshots = list_snapshots()
+
+    # Create the Dash application
+    server = Flask(__name__)
+    if Compress is not None:
+        server.config["COMPRESS_ALGORITHM"] = ["br", "gzip"]
+        server.config["COMPRESS_MIN_SIZE"] = 2048
+        Compress(server)
+    app = dash.Dash(
+        __name__,
+        server=server,
+        assets_folder=os.path.join(os.path.dirname(__file__), 'Styling', 'CSS'),
+        suppress_callback_exceptions=True
+    )
+
+    # Second-level figure cache shared by all workers; keys include the snapshot mtime, so edits never hit stale entries
+    graph_figure = _cached_graph
+    if Cache is not None:
+        figure_cache = Cache(server, config={
+            "CACHE_TYPE": "FileSystemCache",
+            "CACHE_DIR": os.path.join(".cache", "figures"),
+            "CACHE_DEFAULT_TIMEOUT": 3600,
+            "CACHE_THRESHOLD": 500
+        })
+        graph_figure = figure_cache.memoize()(_cached_graph)
+
+    # Prebuild default views in the background so the first snapshot selection is a cache hit.
+    # One daemon thread: it never delays shutdown and leaves the request threads most of the GIL.
+    # MHC_WARMUP=0 turns it off, e.g. for extra WSGI workers that can rely on the shared figure cache.
+    if os.environ.get("MHC_WARMUP", "1") == "1":
+        threading.Thread(target=_warm_graph_cache, args=(graph_figure, snapshots), name="graph-warmup",
+                         daemon=True).start()
+
+    # No validation_layout: with suppress_callback_exceptions=True Dash never reads it, so building both
+    # page trees for it only slowed startup.
     # Router
     app.layout = html.Div([
         dcc.Location(id='url'),
@@ -304,57 +455,115 @@ def main():
 
     @app.callback(Output('page-content', 'children'), Input('url', 'pathname'))
     def display_page(pathname):
-        if pathname == '/compare':
-            return compare_layout()
-        return home_layout()
+        return _compare_layout() if pathname == '/compare' else _home_layout()
+
+    # Select the first snapshot only once the page shell is on screen, so the first graph build
+    # runs behind the loading spinner instead of delaying the initial render
+    app.clientside_callback(
+        """
+        function(options, value) {
+            if (value || !options || !options.length) {
+                return window.dash_clientside.no_update;
+            }
+            return options[0].value;
+        }
+        """,
+        Output("snapshot-dropdown", "value"),
+        Input("snapshot-dropdown", "options"),
+        State("snapshot-dropdown", "value")
+    )
 
-    # Populate program filter options and defaults when snapshot changes
+    # Fetch each snapshot's program list once per page session; the browser keeps it in programs-store
     @app.callback(
-        [Output("program-filter", "options"), Output("program-filter", "value")],
-        Input("snapshot-dropdown", "value")
+        Output("programs-store", "data"),
+        Input("snapshot-dropdown", "value"),
+        State("programs-store", "data")
     )
-    def populate_program_filter(selected_snapshot):
-        if not selected_snapshot:
-            return [], []
+    def load_programs(selected_snapshot, store):
+        if not selected_snapshot or selected_snapshot in (store or {}):
+            return dash.no_update
         try:
-            snapshot_folder = os.path.join("Snapshots", selected_snapshot)
-            json_files = [f for f in os.listdir(snapshot_folder) if f.endswith('.json')]
-            nodes = find_nodes(json_files, snapshot_folder)
-            nodes = create_secondary_nodes(nodes)
-            programs = sorted({n.get('program') for n in nodes if n.get('program')})
-            options = [{"label": p, "value": p} for p in programs]
-            return options, programs
-        except Exception as e:
-            print(f"Error populating program filter: {e}")
-            return [], []
+            programs = _load_nodes(selected_snapshot)[3]
+        except Exception:
+            log.exception("Error populating program filter for %s", selected_snapshot)
+            programs = []
+        return {**(store or {}), selected_snapshot: programs}
+
+    # Populate program filter options and defaults (all programs) in the browser when the snapshot changes
+    app.clientside_callback(
+        """
+        function(snapshot, store) {
+            const programs = (snapshot && store && store[snapshot]) || [];
+            return [programs.map(p => ({label: p, value: p})), programs];
+        }
+        """,
+        [Output("program-filter", "options"), Output("program-filter", "value")],
+        [Input("snapshot-dropdown", "value"), Input("programs-store", "data")]
+    )
+
+    # Large graphs draw programs as single nodes (see Graph._LOD_NODE_MIN); clicking one expands it
+    @app.callback(
+        Output("expanded-programs", "data"),
+        [Input("network-graph", "clickData"), Input("snapshot-dropdown", "value")],
+        State("expanded-programs", "data"),
+        prevent_initial_call=True
+    )
+    def expand_program(clickData, _selected_snapshot, expanded):
+        if dash.callback_context.triggered_id == "snapshot-dropdown":
+            return []
+        points = (clickData or {}).get('points') or [{}]
+        clicked = points[0].get('customdata')
+        if not isinstance(clicked, str) or not clicked.startswith(Graph.CLUSTER_PREFIX):
+            return dash.no_update
+        program = clicked[len(Graph.CLUSTER_PREFIX):]
+        if program in (expanded or []):
+            return dash.no_update
+        return (expanded or []) + [program]
 
     # Update the graph based on filters
     @app.callback(
-        Output("network-graph", "figure"),
-        [Input("snapshot-dropdown", "value"), Input("class-filter", "value"), Input("program-filter", "value"), Input("search-filter", "value"), Input("json-highlight", "value"), Input("content-highlight", "value")]
+        [Output("network-graph", "figure"), Output("graph-state", "data")],
+        [Input("snapshot-dropdown", "value"), Input("class-filter", "value"), Input("program-filter", "value"), Input("search-filter", "value"), Input("json-highlight", "value"), Input("content-highlight", "value"), Input("expanded-programs", "data")],
+        State("graph-state", "data")
     )
-    def update_graph(selected_snapshot, included_classes, included_programs, search_text, json_highlight, content_highlight):
+    def update_graph(selected_snapshot, included_classes, included_programs, search_text, json_highlight, content_highlight, expanded_programs, shown_state):
         if not selected_snapshot:
-            return {}
+            return {}, None
         try:
-            return Graph.create_network_graph(
+            signature = snapshot_signature(selected_snapshot)
+            classes_key = tuple(sorted(set(included_classes))) if included_classes is not None else None
+            programs_key = tuple(sorted(set(included_programs))) if included_programs is not None else None
+            expanded_key = tuple(sorted(set(expanded_programs or ())))
+            fig = graph_figure(
                 selected_snapshot,
-                include_classes=included_classes,
-                include_programs=included_programs,
-                name_contains=(search_text or None),
-                highlight_json_contains=(json_highlight or None),
-                highlight_content_contains=(content_highlight or None)
+                signature,
+                classes_key,
+                programs_key,
+                search_text or None,
+                json_highlight or None,
+                content_highlight or None,
+                expanded_key
             )
-        except Exception as e:
-            print(f"Error creating graph: {e}")
-            return {}
+            # As it comes back from the browser: lists, and the signature as text (it exceeds JS integer precision)
+            state = [selected_snapshot, str(signature), list(classes_key) if classes_key is not None else None,
+                     list(programs_key) if programs_key is not None else None, search_text or None, list(expanded_key)]
+            # A highlight change on the figure already on screen only recolours node borders, so ship just those
+            if (dash.callback_context.triggered_id in ("json-highlight", "content-highlight")
+                    and shown_state == state and fig.get("data")):
+                patched = Patch()
+                patched["data"][len(fig["data"]) - 1]["marker"]["line"] = fig["data"][-1]["marker"]["line"]
+                return patched, dash.no_update
+            return fig, state
+        except Exception:
+            log.exception("Error creating graph for %s", selected_snapshot)
+            return {}, None
 
     @app.callback(
         Output("snapshot-dropdown", "options"),
         Input("refresh-button", "n_clicks")
     )
     def refresh_snapshots(n_clicks):
-        snapshots = [d for d in os.listdir("Snapshots") if os.path.isdir(os.path.join("Snapshots", d))]
+        snapshots = list_snapshots()
         return [{"label": s, "value": s} for s in snapshots]
 
     # Reset search filter
@@ -387,98 +596,98 @@ def main():
             return ""
         return dash.no_update
 
-    # Unified download handler that also updates the status box
-    @app.callback(
-        [
-            Output("download-incentive-button", "n_clicks"),
-            Output("download-message-button", "n_clicks"),
-            Output("download-custom-fields-button", "n_clicks"),
-            Output("download-page-layout-button", "n_clicks"),
-            Output("download-status", "children"),
-        ],
-        [
-            Input("download-incentive-button", "n_clicks"),
-            Input("download-message-button", "n_clicks"),
-            Input("download-custom-fields-button", "n_clicks"),
-            Input("download-page-layout-button", "n_clicks"),
-        ],
-        State("snapshot-dropdown", "value")
-    )
-    def handle_downloads(inc_clicks, msg_clicks, cf_clicks, pl_clicks, selected_snapshot):
-        ctx = dash.callback_context
-        if not ctx.triggered:
-            return dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update
-
-        trigger_id = ctx.triggered[0]["prop_id"].split(".")[0]
-
-        # Default returns: no updates + empty status
-        reset_vals = [dash.no_update, dash.no_update, dash.no_update, dash.no_update]
-        status = ""
-
-        if not selected_snapshot:
-            status = "Please select a snapshot before downloading."
-            return reset_vals[0], reset_vals[1], reset_vals[2], reset_vals[3], status
-
+    # Background callbacks run exports in a job process so the web worker stays free; progress goes to the status box
+    background_manager = None
+    if diskcache is not None:
+        try:
+            background_manager = dash.DiskcacheManager(diskcache.Cache(os.path.join(".cache", "background")))
+        except ImportError as e:
+            print(f"Running downloads in the foreground: {e}")
+
+    # One callback serves every download button; the clicked button's "kind" picks the export and its
+    # dcc.Download target. The status box is shared with the progress updates, hence allow_duplicate.
+    download_outputs = [Output({"type": "download-file", "kind": ALL}, "data"),
+                        Output("download-status", "children", allow_duplicate=True)]
+    download_inputs = [Input({"type": "download-button", "kind": ALL}, "n_clicks"),
+                       State("snapshot-dropdown", "value")]
+
+    def run_export(clicks, selected_snapshot, progress=None):
+        kind = dash.ctx.triggered_id["kind"] if dash.ctx.triggered_id else None
+        n_clicks = dict(zip((i["id"]["kind"] for i in dash.ctx.inputs_list[0]), clicks)).get(kind)
+        # A re-rendered button (e.g. after navigating back from the compare page) must not clear the status box
+        if not n_clicks:
+            raise PreventUpdate
         try:
-            if trigger_id == "download-incentive-button" and inc_clicks:
-                status = download_incentive_content_as_csv(inc_clicks, selected_snapshot) or ""
-                reset_vals[0] = None
-            elif trigger_id == "download-message-button" and msg_clicks:
-                status = download_message_content_as_csv(msg_clicks, selected_snapshot) or ""
-                reset_vals[1] = None
-            elif trigger_id == "download-custom-fields-button" and cf_clicks:
-                status = download_client_custom_fields_content_as_csv(cf_clicks, selected_snapshot) or ""
-                reset_vals[2] = None
-            elif trigger_id == "download-page-layout-button" and pl_clicks:
-                status = download_client_page_layout_content_as_csv(pl_clicks, selected_snapshot) or ""
-                reset_vals[3] = None
+            status, download = DOWNLOAD_KINDS[kind](n_clicks, selected_snapshot, progress)
         except Exception as e:
-            status = f"Error during download: {e}"
-
-        return reset_vals[0], reset_vals[1], reset_vals[2], reset_vals[3], status
+            status, download = f"Error during download: {e}", None
+        data = [download if o["id"]["kind"] == kind and download is not None else dash.no_update
+                for o in dash.ctx.outputs_list[0]]
+        return data, status or ""
+
+    if background_manager is None:
+        app.callback(download_outputs, download_inputs, prevent_initial_call=True)(run_export)
+    else:
+        @app.callback(
+            download_outputs,
+            download_inputs,
+            background=True,
+            manager=background_manager,
+            running=[(Output({"type": "download-button", "kind": ALL}, "disabled"), True, False)],
+            progress=Output("download-status", "children"),
+            prevent_initial_call=True
+        )
+        def handle_download(set_progress, clicks, selected_snapshot):
+            return run_export(clicks, selected_snapshot, set_progress)
+
+    # Connection link clicks are resolved in the browser, so the server callback below gets one small store value
+    # instead of the n_clicks of every link in the panel. "at" makes clicking the same link again still fire.
+    app.clientside_callback(
+        """
+        function(_clicks) {
+            const clicked = window.dash_clientside.callback_context.triggered.filter(t => t.value);
+            if (!clicked.length) {
+                return window.dash_clientside.no_update;
+            }
+            const propId = clicked[0].prop_id;
+            const linkId = JSON.parse(propId.slice(0, propId.lastIndexOf(".")));
+            return {name: linkId.name, at: Date.now()};
+        }
+        """,
+        Output("clicked-node-store", "data"),
+        Input({"type": "node-link", "name": ALL}, "n_clicks"),
+        prevent_initial_call=True
+    )
 
     @app.callback(
         Output("node-info", "children"),
         [
             Input("network-graph", "clickData"),
-            Input({"type": "node-link", "name": ALL}, "n_clicks"),
+            Input("clicked-node-store", "data"),
             Input("snapshot-dropdown", "value"),
         ]
     )
-    def display_clicked_node_info(clickData, node_link_clicks, selected_snapshot):
+    def display_clicked_node_info(clickData, clicked_link, selected_snapshot):
         if not selected_snapshot:
             return html.Div("Click a node to see details", className="muted-text")
 
-        # Determine what triggered the callback
-        ctx = dash.callback_context
-        triggered = ctx.triggered[0]["prop_id"].split(".")[0] if ctx.triggered else None
+        trig_id = dash.callback_context.triggered_id
 
         try:
-            snapshot_folder = os.path.join("Snapshots", selected_snapshot)
-            json_files = [f for f in os.listdir(snapshot_folder) if f.endswith('.json')]
-            nodes = find_nodes(json_files, snapshot_folder)
-            nodes = create_secondary_nodes(nodes)
-
-            # If a connection link button was clicked
-            if triggered and triggered.startswith("{"):
-                try:
-                    trig_id = json.loads(triggered)
-                    if isinstance(trig_id, dict) and trig_id.get("type") == "node-link":
-                        clicked_node = trig_id.get("name")
-                        node_details = next((n for n in nodes if n['name'] == clicked_node), None)
-                        if node_details:
-                            return node_clicked(node_details, nodes)
-                except Exception:
-                    pass
-
-            # Fallback to graph click handling
+            # Candidate nodes in priority order: a clicked connection link, then the clicked graph point
+            candidates = []
+            if trig_id == "clicked-node-store" and clicked_link:
+                candidates.append(clicked_link.get("name"))
             if clickData and 'points' in clickData:
                 point = clickData['points'][0]
                 if 'customdata' in point:
-                    clicked_node = point['customdata']
-                    node_details = next((n for n in nodes if n['name'] == clicked_node), None)
-                    if node_details:
-                        return node_clicked(node_details, nodes)
+                    candidates.append(point['customdata'])
+
+            signature = snapshot_signature(selected_snapshot)
+            for clicked_node in candidates:
+                panel = _node_panel(selected_snapshot, signature, clicked_node)
+                if panel:
+                    return panel
 
             return html.Div("Click a node to see details", className="muted-text")
 
@@ -486,32 +695,97 @@ def main():
             return html.Div(f"Error loading node details: {str(e)}")
 
     # --- Compare page callbacks ---
-    from Compare import build_compare
+    # Compare is imported on first use, so starting the app and the main page never pay for it
 
+    # Keep snapshot options fresh without re-running the comparison
     @app.callback(
-        [Output("compare-graph-a", "figure"), Output("compare-graph-b", "figure"), Output("compare-diff", "children"), Output("compare-snapshot-a", "options"), Output("compare-snapshot-b", "options")],
-        [Input("compare-snapshot-a", "value"), Input("compare-snapshot-b", "value"), Input("compare-refresh-button", "n_clicks"), Input("compare-run-button", "n_clicks")]
+        [Output("compare-snapshot-a", "options"), Output("compare-snapshot-b", "options")],
+        Input("compare-refresh-button", "n_clicks")
     )
-    def update_compare(a, b, _refresh_clicks, _run_clicks):
-        # keep snapshot options fresh
-        snaps = [d for d in os.listdir("Snapshots") if os.path.isdir(os.path.join("Snapshots", d))]
+    def refresh_compare_options(_refresh_clicks):
+        snaps = list_snapshots()
         options = [{"label": s, "value": s} for s in snaps]
+        return options, options
+
+    # Default to the first two snapshots once the options arrive, keeping any existing choice
+    app.clientside_callback(
+        """
+        function(options, a, b) {
+            const values = (options || []).map(o => o.value);
+            if (!values.length || (a && b)) {
+                return window.dash_clientside.no_update;
+            }
+            return [a || values[0], b || values[values.length > 1 ? 1 : 0]];
+        }
+        """,
+        [Output("compare-snapshot-a", "value"), Output("compare-snapshot-b", "value")],
+        Input("compare-snapshot-a", "options"),
+        [State("compare-snapshot-a", "value"), State("compare-snapshot-b", "value")]
+    )
+
+    # Figures and the differences panel are separate callbacks backed by separately memoized builders
+    @app.callback(
+        [Output("compare-graph-a", "figure"), Output("compare-graph-b", "figure")],
+        [Input("compare-snapshot-a", "value"), Input("compare-snapshot-b", "value"), Input("compare-run-button", "n_clicks")]
+    )
+    def update_compare_graphs(a, b, _run_clicks):
         if not a or not b or a == b:
-            # Empty figures and guidance when invalid selection
-            msg = "Select two different snapshots to compare."
-            empty = {"data": [], "layout": {"title": msg}}
-            return empty, empty, html.Div(msg, className="muted-text"), options, options
+            # Empty figures when invalid selection
+            empty = {"data": [], "layout": {"title": "Select two different snapshots to compare."}}
+            return empty, empty
         try:
-            fig_a, fig_b, diff_children = build_compare(a, b)
-            return fig_a, fig_b, diff_children, options, options
-        except Exception as e:
-            err = html.Div(f"Error comparing snapshots: {e}")
+            from Compare import build_compare_figures
+            return build_compare_figures(a, b)
+        except Exception:
+            log.exception("Error comparing snapshots %s and %s", a, b)
             empty = {"data": [], "layout": {"title": "Error"}}
-            return empty, empty, err, options, options
+            return empty, empty
+
+    @app.callback(
+        Output("compare-diff", "children"),
+        [Input("compare-snapshot-a", "value"), Input("compare-snapshot-b", "value"), Input("compare-run-button", "n_clicks")]
+    )
+    def update_compare_diff(a, b, _run_clicks):
+        if not a or not b or a == b:
+            # Guidance when invalid selection
+            return html.Div("Select two different snapshots to compare.", className="muted-text")
+        try:
+            from Compare import build_compare_diff
+            return build_compare_diff(a, b)
+        except Exception as e:
+            log.exception("Error comparing snapshots %s and %s", a, b)
+            return html.Div(f"Error comparing snapshots: {e}")
+
+    # Render a changed node's diff on the first click of its Details. html.Details never reports its "open"
+    # prop back to Dash, but clicks (on the summary or inside the body) do update n_clicks; a filled slot is kept.
+    @app.callback(
+        Output({'type': 'diff-slot', 'name': MATCH}, 'children'),
+        Input({'type': 'diff-details', 'name': MATCH}, 'n_clicks'),
+        [State("compare-snapshot-a", "value"), State("compare-snapshot-b", "value"),
+         State({'type': 'diff-slot', 'name': MATCH}, 'children')],
+        prevent_initial_call=True
+    )
+    def render_node_diff(n_clicks, a, b, current):
+        if not n_clicks or current or not a or not b:
+            return dash.no_update
+        name = dash.callback_context.triggered_id['name']
+        try:
+            from Compare import build_node_diff
+            return build_node_diff(a, b, name)
+        except Exception as e:
+            return html.Div(f"Error comparing node: {e}")
 
     return app
 
 
 if __name__ == "__main__":
     app = main()
-    app.run(debug=True)
+    host = os.getenv("HOST", "127.0.0.1")
+    port = int(os.getenv("PORT", "8050"))
+    if os.getenv("USE_WAITRESS") == "1":
+        # Multi-threaded production server in this process; see wsgi.py for multi-worker gunicorn
+        from waitress import serve
+        serve(app.server, host=host, port=port, threads=8)
+    else:
+        # Debug mode (reloader, dev tools) only when DEBUG=1
+        app.run(host=host, port=port, debug=os.getenv("DEBUG") == "1")
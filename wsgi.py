@@ -0,0 +1,5 @@
+"""WSGI entrypoint for production servers, e.g. `gunicorn -w 4 -k gthread --threads 4 wsgi:server`."""
+from main import main
+
+app = main()
+server = app.server